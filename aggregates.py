@@ -0,0 +1,554 @@
+# aggregates.py
+# Инкрементально поддерживаемые групповые агрегаты по 12 факторам.
+# Состояние хранится рядом с хранилищем (<path>.agg.json) вместе с меткой
+# версии данных; при расхождении метки агрегаты пересчитываются из сырых строк.
+# Кроме сумм хранятся гистограммы баллов по факторам — по ним перцентиль
+# респондента относительно группы находится за O(1), без сортировки строк,
+# и «куб» FactorStats по комбинациям атрибутов подгруппы (факультет, уровень)
+# с такими же точными гистограммами для каждой ячейки,
+# а также суммы баллов по дням (TrendBuckets) для динамики во времени.
+
+import datetime
+import functools
+import itertools
+import json
+import os
+
+import numpy as np
+
+from scoring import FACTOR_IDS, FACTOR_NAMES, MAX_FACTOR_SCORES
+from storage import COHORT_COLUMNS, FACTOR_COLUMNS, file_lock
+
+
+class FactorStats:
+    """
+    Число наблюдений, сумма, сумма квадратов, минимум и максимум по каждому
+    фактору (в порядке FACTOR_IDS). Баллы — целые числа, поэтому суммы
+    хранятся точно и дисперсия не теряет точности.
+    """
+
+    def __init__(self, count=0, sums=None, sumsq=None, mins=None, maxs=None):
+        n = len(FACTOR_IDS)
+        self.count = count
+        self.sums = list(sums) if sums is not None else [0] * n
+        self.sumsq = list(sumsq) if sumsq is not None else [0] * n
+        self.mins = list(mins) if mins is not None else [None] * n
+        self.maxs = list(maxs) if maxs is not None else [None] * n
+
+    def add_batch(self, scores):
+        """scores: массив формы (N, 12) в порядке FACTOR_IDS."""
+        scores = np.asarray(scores, dtype=np.int64)
+        if scores.size == 0:
+            return
+        self.count += scores.shape[0]
+        for i, (s, sq, lo, hi) in enumerate(zip(
+            scores.sum(axis=0), (scores * scores).sum(axis=0),
+            scores.min(axis=0), scores.max(axis=0),
+        )):
+            self.sums[i] += int(s)
+            self.sumsq[i] += int(sq)
+            self.mins[i] = int(lo) if self.mins[i] is None else min(self.mins[i], int(lo))
+            self.maxs[i] = int(hi) if self.maxs[i] is None else max(self.maxs[i], int(hi))
+
+    def means(self):
+        """dict {factor_id: mean}; пустой, если наблюдений нет."""
+        if not self.count:
+            return {}
+        return {fid: s / self.count for fid, s in zip(FACTOR_IDS, self.sums)}
+
+    def stds(self):
+        """Выборочное стандартное отклонение по факторам."""
+        if self.count < 2:
+            return {fid: 0.0 for fid in FACTOR_IDS} if self.count else {}
+        n = self.count
+        return {
+            fid: ((sq - s * s / n) / (n - 1)) ** 0.5
+            for fid, s, sq in zip(FACTOR_IDS, self.sums, self.sumsq)
+        }
+
+    def copy(self):
+        return FactorStats(self.count, self.sums, self.sumsq, self.mins, self.maxs)
+
+    def to_dict(self):
+        return {
+            "count": self.count, "sums": self.sums, "sumsq": self.sumsq,
+            "mins": self.mins, "maxs": self.maxs,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["count"], d["sums"], d["sumsq"], d["mins"], d["maxs"])
+
+
+HIST_BINS = max(MAX_FACTOR_SCORES.values()) + 1
+
+
+class FactorHistogram:
+    """
+    Частоты баллов по факторам: матрица (12, HIST_BINS). Баллы — небольшие
+    целые, поэтому гистограмма точная, а накопленные частоты дают перцентиль
+    за одно обращение к массиву.
+    """
+
+    def __init__(self, counts=None):
+        if counts is None:
+            counts = np.zeros((len(FACTOR_IDS), HIST_BINS), dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64).reshape(len(FACTOR_IDS), HIST_BINS)
+        self._below = None
+        self._sparse = None
+
+    @property
+    def count(self):
+        return int(self.counts[0].sum())
+
+    def add_batch(self, scores):
+        """scores: массив формы (N, 12) в порядке FACTOR_IDS."""
+        scores = np.asarray(scores, dtype=np.int64).reshape(-1, len(FACTOR_IDS))
+        if not len(scores):
+            return
+        # у другой версии опросника максимум фактора может быть больше —
+        # такие баллы попадают в последний столбец
+        scores = np.clip(scores, 0, HIST_BINS - 1)
+        for i in range(len(FACTOR_IDS)):
+            self.counts[i] += np.bincount(scores[:, i], minlength=HIST_BINS)
+        self._below = None
+        self._sparse = None
+
+    def _cumulative(self):
+        # below[i, v] — сколько наблюдений фактора i со значением меньше v
+        if self._below is None:
+            below = np.zeros((len(FACTOR_IDS), HIST_BINS + 1), dtype=np.int64)
+            np.cumsum(self.counts, axis=1, out=below[:, 1:])
+            self._below = below
+        return self._below
+
+    def percentile_rank(self, fid, score):
+        """
+        Процент группы ниже балла (совпадающие значения считаются наполовину),
+        0..100; None, если наблюдений нет.
+        """
+        n = self.count
+        if not n:
+            return None
+        i = FACTOR_IDS.index(fid)
+        v = min(max(int(score), 0), HIST_BINS - 1)
+        below = self._cumulative()[i]
+        return 100.0 * (below[v] + 0.5 * self.counts[i, v]) / n
+
+    def percentiles(self, factor_scores):
+        """dict {factor_id: перцентиль} для баллов одного респондента; пустой без данных."""
+        if not self.count:
+            return {}
+        return {fid: self.percentile_rank(fid, score) for fid, score in factor_scores.items()}
+
+    def copy(self):
+        hist = FactorHistogram(self.counts.copy())
+        # кэши не меняются на месте (add_batch их заменяет), их можно делить
+        hist._below, hist._sparse = self._below, self._sparse
+        return hist
+
+    def to_dict(self):
+        return {"counts": self.counts.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["counts"])
+
+    def to_sparse(self):
+        """
+        По фактору [первый ненулевой балл, частоты до последнего ненулевого].
+        Результат кэшируется до следующего add_batch: при дозаписи меняются
+        лишь несколько ячеек куба, остальные не пересчитываются.
+        """
+        if self._sparse is None:
+            nonzero = self.counts > 0
+            first = nonzero.argmax(axis=1).tolist()
+            last = (HIST_BINS - 1 - nonzero[:, ::-1].argmax(axis=1)).tolist()
+            self._sparse = [
+                [lo] + row[lo:hi + 1] if hi >= lo and row[lo] else [0]
+                for row, lo, hi in zip(self.counts.tolist(), first, last)
+            ]
+        return self._sparse
+
+    @classmethod
+    def from_sparse(cls, rows):
+        counts = np.zeros((len(FACTOR_IDS), HIST_BINS), dtype=np.int64)
+        for i, (start, *values) in enumerate(rows):
+            counts[i, start:start + len(values)] = values
+        hist = cls(counts)
+        hist._sparse = rows
+        return hist
+
+
+ALL = "*"
+# значение "*" (и всё, что начинается с обратной косой черты) в ключе куба
+# экранируется ею, чтобы свободный текст не совпал с ячейкой «все значения»
+_ESCAPE = "\\"
+
+
+def cohort_value(value):
+    """Значение атрибута подгруппы как ключ куба: пропуск -> "", "*" -> "\\*"."""
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    value = str(value).strip()
+    if value == ALL or value.startswith(_ESCAPE):
+        return _ESCAPE + value
+    return value
+
+
+def _unescape(key):
+    return key[len(_ESCAPE):] if key.startswith(_ESCAPE) else key
+
+
+class CohortCube:
+    """
+    FactorStats и точная гистограмма (перцентили подгруппы) для каждой
+    комбинации атрибутов подгруппы (порядок COHORT_COLUMNS), включая
+    частичные: строка с ключом (f, l) попадает в ячейки (f, l), (f, *),
+    (*, l) и (*, *). Любая комбинация фильтров по подгруппам — одно
+    обращение к словарю, без чтения строк.
+    """
+
+    def __init__(self, cells=None, hists=None):
+        self.cells = cells or {}
+        self.hists = hists or {}
+
+    def add_batch(self, scores, keys):
+        """scores: (N, 12); keys: N кортежей значений COHORT_COLUMNS."""
+        scores = np.asarray(scores).reshape(-1, len(FACTOR_IDS))
+        groups = {}
+        for i, key in enumerate(keys):
+            for cell in itertools.product(*((v, ALL) for v in key)):
+                groups.setdefault(cell, []).append(i)
+        # ячейки заменяются копиями, а не меняются на месте: после copy()
+        # они общие с опубликованным состоянием, которое читают другие сессии
+        for cell, idx in groups.items():
+            stats = self.cells[cell].copy() if cell in self.cells else FactorStats()
+            hist = self.hists[cell].copy() if cell in self.hists else FactorHistogram()
+            stats.add_batch(scores[idx])
+            hist.add_batch(scores[idx])
+            self.cells[cell], self.hists[cell] = stats, hist
+
+    def copy(self):
+        """Копия словарей ячеек; сами ячейки общие до следующего add_batch."""
+        return CohortCube(dict(self.cells), dict(self.hists))
+
+    @staticmethod
+    def _cell(filters):
+        return tuple(cohort_value(filters.get(col)) or ALL for col in COHORT_COLUMNS)
+
+    def get(self, **filters):
+        """FactorStats подгруппы, например get(faculty="ФЭН", level="N-2")."""
+        return self.cells.get(self._cell(filters)) or FactorStats()
+
+    def histogram(self, **filters):
+        """Гистограмма подгруппы (FactorHistogram), например для перцентилей."""
+        return self.hists.get(self._cell(filters)) or FactorHistogram()
+
+    def values(self, column):
+        """Встречающиеся значения атрибута (без пустого), по алфавиту."""
+        i = COHORT_COLUMNS.index(column)
+        return sorted(_unescape(v) for v in {cell[i] for cell in self.cells} - {ALL, ""})
+
+    def breakdown(self, column, **filters):
+        """
+        {значение column: FactorStats} при остальных атрибутах из filters
+        (не заданные — по всем значениям). Пустое значение — «не указано».
+        """
+        i = COHORT_COLUMNS.index(column)
+        base = list(self._cell(filters))
+        out = {}
+        for cell, stats in self.cells.items():
+            if cell[i] != ALL and all(cell[j] == base[j] for j in range(len(base)) if j != i):
+                out[_unescape(cell[i])] = stats
+        return dict(sorted(out.items()))
+
+    def to_dict(self):
+        return [
+            # гистограммы ячеек разрежены: хранится только диапазон с ненулевыми частотами
+            [list(cell), stats.to_dict(), self.hists[cell].to_sparse()]
+            for cell, stats in self.cells.items()
+        ]
+
+    @classmethod
+    def from_dict(cls, d):
+        cells, hists = {}, {}
+        for cell, stats, counts in d:
+            cells[tuple(cell)] = FactorStats.from_dict(stats)
+            hists[tuple(cell)] = FactorHistogram.from_sparse(counts)
+        return cls(cells, hists)
+
+
+TREND_FREQS = ("day", "week", "month")
+
+
+def _period_start(day, freq):
+    if freq == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if freq == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _next_period(start, freq):
+    if freq == "week":
+        return start + datetime.timedelta(days=7)
+    if freq == "month":
+        return (start + datetime.timedelta(days=32)).replace(day=1)
+    return start + datetime.timedelta(days=1)
+
+
+class TrendBuckets:
+    """
+    Число ответов и суммы баллов по факторам за каждый день (ключ — дата
+    ISO из метки времени строки). Недели и месяцы сворачиваются из дней,
+    поэтому ряд за год — несколько сотен сложений, без разбора меток
+    времени всех строк.
+    """
+
+    def __init__(self, days=None):
+        # день -> [count, сумма фактора 1, ..., сумма фактора 12]
+        self.days = days or {}
+
+    def add_batch(self, scores, days):
+        """scores: (N, 12); days: N строк «YYYY-MM-DD...» (лишнее отбрасывается)."""
+        scores = np.asarray(scores, dtype=np.int64).reshape(-1, len(FACTOR_IDS))
+        if not len(scores):
+            return
+        keys, inverse = np.unique(np.asarray(days, dtype="U10"), return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        counts = np.bincount(inverse, minlength=len(keys))
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.add.reduceat(scores[order], starts, axis=0)
+        for key, n, row in zip(keys.tolist(), counts.tolist(), sums.tolist()):
+            try:
+                datetime.date.fromisoformat(key)
+            except ValueError:
+                continue  # строки без разбираемой даты в динамику не попадают
+            # новый список вместо правки на месте — как ячейки CohortCube
+            bucket = list(self.days.get(key) or [0] * (len(FACTOR_IDS) + 1))
+            bucket[0] += n
+            for i, s in enumerate(row, 1):
+                bucket[i] += s
+            self.days[key] = bucket
+
+    def series(self, freq="day", window=1):
+        """
+        Ряд по периодам freq («day», «week» — с понедельника, «month») от
+        первого до последнего периода с ответами, без пропусков: начала
+        периодов, число ответов (P,) и средние (P, 12), NaN — где ответов нет.
+        window > 1 — скользящее окно из window периодов: средние по всем
+        ответам окна, а не среднее средних.
+        """
+        if freq not in TREND_FREQS:
+            raise ValueError(f"неизвестный период: {freq!r}")
+        if not self.days:
+            return [], np.zeros(0, dtype=np.int64), np.zeros((0, len(FACTOR_IDS)))
+        index = {}
+        for key in self.days:
+            index.setdefault(_period_start(datetime.date.fromisoformat(key), freq), []).append(key)
+        periods = [min(index)]
+        last = max(index)
+        while periods[-1] < last:
+            periods.append(_next_period(periods[-1], freq))
+
+        totals = np.zeros((len(periods) + 1, len(FACTOR_IDS) + 1), dtype=np.int64)
+        for i, period in enumerate(periods, 1):
+            for key in index.get(period, ()):
+                totals[i] += self.days[key]
+        np.cumsum(totals, axis=0, out=totals)
+        window = max(int(window), 1)
+        lo = np.maximum(np.arange(1, len(periods) + 1) - window, 0)
+        sums = totals[1:] - totals[lo]
+        counts = sums[:, 0]
+        means = np.full((len(periods), len(FACTOR_IDS)), np.nan)
+        np.divide(sums[:, 1:], counts[:, None], out=means, where=counts[:, None] > 0)
+        return periods, counts, means
+
+    def copy(self):
+        return TrendBuckets(dict(self.days))
+
+    def to_dict(self):
+        return self.days
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls({day: list(bucket) for day, bucket in d.items()})
+
+
+# формат файла состояния: при несовпадении агрегаты пересчитываются из строк
+STATE_FORMAT = 3
+
+
+class GroupAggregates:
+    """Агрегаты по всей группе, привязанные к версии данных хранилища."""
+
+    def __init__(self, version="0", total=None, hist=None, cube=None, trend=None):
+        self.version = version
+        self.total = total or FactorStats()
+        self.hist = hist or FactorHistogram()
+        self.cube = cube or CohortCube()
+        self.trend = trend or TrendBuckets()
+
+    def add_rows(self, rows):
+        """rows: список dict в формате строк результатов."""
+        self.add_scores(
+            [[int(row[FACTOR_NAMES[fid]]) for fid in FACTOR_IDS] for row in rows],
+            [tuple(cohort_value(row.get(col)) for col in COHORT_COLUMNS) for row in rows],
+            [str(row.get("timestamp") or "")[:10] for row in rows],
+        )
+
+    def add_frame(self, df):
+        """df: порция строк результатов из хранилища."""
+        cohorts = [df[col].tolist() if col in df else [None] * len(df) for col in COHORT_COLUMNS]
+        self.add_scores(
+            df[FACTOR_COLUMNS].to_numpy(),
+            [tuple(cohort_value(v) for v in key) for key in zip(*cohorts)],
+            df["timestamp"].fillna("").astype(str).str.slice(0, 10).to_numpy(),
+        )
+
+    def copy(self):
+        """
+        Копия для дозаписи: опубликованное состояние (_memo) не меняется на
+        месте, его без блокировки читают другие сессии.
+        """
+        return GroupAggregates(
+            self.version, self.total.copy(), self.hist.copy(), self.cube.copy(), self.trend.copy()
+        )
+
+    def add_scores(self, scores, cohort_keys, days):
+        scores = np.asarray(scores).reshape(-1, len(FACTOR_IDS))
+        self.total.add_batch(scores)
+        self.hist.add_batch(scores)
+        self.cube.add_batch(scores, cohort_keys)
+        self.trend.add_batch(scores, days)
+
+    def to_dict(self):
+        return {
+            "format": STATE_FORMAT,
+            "version": self.version,
+            "total": self.total.to_dict(),
+            "hist": self.hist.to_dict(),
+            "cube": self.cube.to_dict(),
+            "trend": self.trend.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        # состояние старого формата (без гистограмм, куба или дней) даёт KeyError и пересчитывается
+        if d.get("format") != STATE_FORMAT:
+            raise KeyError("format")
+        return cls(
+            d["version"],
+            FactorStats.from_dict(d["total"]),
+            FactorHistogram.from_dict(d["hist"]),
+            CohortCube.from_dict(d["cube"]),
+            TrendBuckets.from_dict(d["trend"]),
+        )
+
+
+# опубликованные агрегаты по пути файла состояния; после публикации объект
+# не меняется, дозапись заменяет его новым одним присваиванием
+_memo = {}
+
+
+def _state_path(store):
+    return store.path + ".agg.json"
+
+
+def _read_state(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return GroupAggregates.from_dict(json.load(f))
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def _write_state(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        # dumps целиком идёт через C-кодировщик, dump в файл — через медленный iterencode
+        f.write(json.dumps(state.to_dict(), separators=(",", ":")))
+    os.replace(tmp, path)
+    _memo[path] = state
+
+
+def rebuild(store):
+    """Пересчитывает агрегаты по всем строкам хранилища порциями."""
+    state = GroupAggregates(store.version())
+    for chunk in store.iter_chunks():
+        state.add_frame(chunk)
+    return state
+
+
+def append_results(store, rows):
+    """
+    Дописывает строки в хранилище и обновляет копию агрегатов под одной
+    блокировкой; копия затем заменяет опубликованное состояние.
+    Если сохранённые агрегаты не соответствуют версии данных до записи,
+    они пересчитываются целиком.
+    """
+    path = _state_path(store)
+    with file_lock(path):
+        before = store.version()
+        store.append(rows)
+        state = _memo.get(path)
+        if state is None or state.version != before:
+            state = _read_state(path)
+        if state is not None and state.version == before:
+            state = state.copy()
+            state.add_rows(rows)
+            state.version = store.version()
+        else:
+            state = rebuild(store)
+        _write_state(path, state)
+
+
+def get_aggregates(store):
+    """Актуальные агрегаты: O(1) при совпадении версии, иначе пересчёт."""
+    path = _state_path(store)
+    version = store.version()
+    state = _memo.get(path)
+    if state is not None and state.version == version:
+        return state
+    state = _read_state(path)
+    if state is not None and state.version == version:
+        _memo[path] = state
+        return state
+    with file_lock(path):
+        # пока ждали блокировку, агрегаты мог пересчитать или дописать другой
+        # читатель или писатель: пересчитываем, только если они всё ещё устарели
+        version = store.version()
+        state = _memo.get(path)
+        if state is None or state.version != version:
+            state = _read_state(path)
+        if state is not None and state.version == version:
+            _memo[path] = state
+            return state
+        state = rebuild(store)
+        _write_state(path, state)
+    return state
+
+
+@functools.lru_cache(maxsize=64)
+def _cohort_histogram(store, version, filters):
+    # version входит в ключ кэша: после записи подгруппа пересчитывается
+    hist = FactorHistogram()
+    for chunk in store.iter_chunks(**dict(filters)):
+        hist.add_batch(chunk[FACTOR_COLUMNS].to_numpy())
+    return hist
+
+
+def get_histogram(store, **filters):
+    """
+    Гистограммы баллов для перцентилей. Вся группа и подгруппы по
+    COHORT_COLUMNS — из сохранённых агрегатов (обновляются при каждой
+    записи); с другими фильтрами (префикс имени, версия опросника) — один
+    проход по строкам подгруппы, кэшируется до следующей записи.
+    """
+    filters = {k: v for k, v in filters.items() if v}
+    if not filters:
+        return get_aggregates(store).hist
+    if set(filters) <= set(COHORT_COLUMNS):
+        return get_aggregates(store).cube.histogram(**filters)
+    return _cohort_histogram(store, store.version(), tuple(sorted(filters.items())))
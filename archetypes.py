@@ -0,0 +1,216 @@
+# archetypes.py
+# Мотивационные архетипы: k-means по 12 факторам, обучаемый мини-пакетами.
+# Центроиды сохраняются рядом с хранилищем (<path>.archetypes.json) вместе
+# с курсором чтения (store.read_after) и меткой версии данных. Новые строки
+# только дообучают модель: каждая порция сдвигает ближайшие центроиды
+# к среднему своих точек с весом 1/n (мини-пакетный k-means), полного
+# переобучения при записи не происходит. Отнесение респондента к архетипу —
+# k расстояний.
+#
+#   python archetypes.py --k 5 --backend sqlite
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from scoring import FACTOR_IDS, FACTOR_NAMES
+from storage import BACKENDS, FACTOR_COLUMNS, StaleCursorError, file_lock, open_store
+
+DEFAULT_K = 5
+BATCH_SIZE = 1024
+FIT_EPOCHS = 3
+SEED = 18
+
+
+class ArchetypeModel:
+    """Центроиды (k, 12) в порядке FACTOR_IDS и число точек в каждом кластере."""
+
+    def __init__(self, centroids, counts=None, version="0", cursor=0, generation=None):
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+        k = len(self.centroids)
+        self.counts = np.asarray(counts if counts is not None else np.zeros(k), dtype=np.int64)
+        self.version = version
+        self.cursor = cursor
+        self.generation = generation  # store.generation(), к которой относится курсор
+
+    @property
+    def k(self):
+        return len(self.centroids)
+
+    def _nearest(self, X):
+        d2 = (
+            (X * X).sum(axis=1)[:, None]
+            - 2 * X @ self.centroids.T
+            + (self.centroids * self.centroids).sum(axis=1)[None, :]
+        )
+        return d2.argmin(axis=1)
+
+    def assign(self, factor_scores):
+        """Номер архетипа (0..k-1) для dict {factor_id: балл}."""
+        x = np.array([factor_scores[fid] for fid in FACTOR_IDS], dtype=np.float64)
+        return int(((self.centroids - x) ** 2).sum(axis=1).argmin())
+
+    def partial_fit(self, X, count=True):
+        """
+        Шаг мини-пакетного k-means по массиву (N, 12): каждый центроид
+        становится средним своих прежних и новых точек.
+        count=False — только сдвинуть центроиды (эпохи первичного обучения).
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(FACTOR_IDS))
+        if not len(X):
+            return
+        labels = self._nearest(X)
+        n_new = np.bincount(labels, minlength=self.k)
+        sums = np.zeros_like(self.centroids)
+        np.add.at(sums, labels, X)
+        seen = np.maximum(self.counts, 1)
+        hit = n_new > 0
+        self.centroids[hit] = (
+            self.centroids[hit] * seen[hit, None] + sums[hit]
+        ) / (seen[hit] + n_new[hit])[:, None]
+        if count:
+            self.counts += n_new
+
+    def labels(self):
+        """Короткие подписи: два фактора, сильнее всего превышающие среднее центроидов."""
+        mean = self.centroids.mean(axis=0)
+        out = []
+        for c in self.centroids:
+            top = np.argsort(-(c - mean), kind="stable")[:2]
+            out.append(" + ".join(FACTOR_NAMES[FACTOR_IDS[i]] for i in top))
+        return out
+
+    def centroid_scores(self, i):
+        """dict {factor_id: балл центроида} для диаграмм."""
+        return {fid: round(float(v), 1) for fid, v in zip(FACTOR_IDS, self.centroids[i])}
+
+    def to_dict(self):
+        return {
+            "version": self.version,
+            "cursor": self.cursor,
+            "generation": self.generation,
+            "centroids": self.centroids.tolist(),
+            "counts": self.counts.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["centroids"], d["counts"], d["version"], d["cursor"], d.get("generation"))
+
+
+def _kmeans_pp(X, k, rng):
+    """Начальные центроиды k-means++ по выборке X."""
+    centroids = [X[rng.integers(len(X))]]
+    d2 = ((X - centroids[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = d2.sum()
+        idx = rng.choice(len(X), p=d2 / total) if total > 0 else rng.integers(len(X))
+        centroids.append(X[idx])
+        d2 = np.minimum(d2, ((X - X[idx]) ** 2).sum(axis=1))
+    return np.array(centroids)
+
+
+def fit(store, k=DEFAULT_K, seed=SEED):
+    """
+    Первичное обучение по всем строкам хранилища: k-means++ на случайной
+    выборке, FIT_EPOCHS проходов мини-пакетами, затем подсчёт размеров
+    кластеров. None, если строк меньше k.
+    """
+    rng = np.random.default_rng(seed)
+    version, generation = store.version(), store.generation()
+    df, cursor = store.read_after(0)
+    X = df[FACTOR_COLUMNS].to_numpy(dtype=np.float64)
+    if len(X) < k:
+        return None
+    sample = X[rng.choice(len(X), size=min(len(X), 10 * BATCH_SIZE), replace=False)]
+    model = ArchetypeModel(
+        _kmeans_pp(sample, k, rng), version=version, cursor=cursor, generation=generation
+    )
+    for _ in range(FIT_EPOCHS):
+        for start in range(0, len(X), BATCH_SIZE):
+            model.partial_fit(X[start:start + BATCH_SIZE], count=False)
+    model.counts = np.bincount(model._nearest(X), minlength=k).astype(np.int64)
+    return model
+
+
+def _state_path(store):
+    return store.path + ".archetypes.json"
+
+
+def _read_state(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return ArchetypeModel.from_dict(json.load(f))
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def _write_state(path, model):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(model.to_dict(), f)
+    os.replace(tmp, path)
+
+
+# путь -> (версия хранилища, k, модель или None, если строк было меньше k)
+_memo = {}
+
+
+def get_model(store, k=DEFAULT_K):
+    """
+    Актуальная модель архетипов: при совпадении версии — из памяти,
+    иначе дообучение на строках, дописанных после курсора модели
+    (или первичное обучение, если модели ещё нет). None, если данных мало;
+    этот ответ тоже запоминается до следующей записи в хранилище.
+    """
+    path = _state_path(store)
+    version = store.version()
+    cached = _memo.get(path)
+    if cached is not None and cached[:2] == (version, k):
+        return cached[2]
+    with file_lock(path):
+        model = _read_state(path)
+        # метка версии берётся до чтения: строки, дописанные во время
+        # чтения, подхватятся следующим вызовом
+        version = store.version()
+        if model is None or model.k != k or model.generation != store.generation():
+            # файл хранилища заменён или переписан — курсор к нему не подходит
+            model = fit(store, k)
+        elif model.version != version:
+            try:
+                df, model.cursor = store.read_after(model.cursor)
+            except StaleCursorError:
+                model = fit(store, k)
+            else:
+                model.partial_fit(df[FACTOR_COLUMNS].to_numpy(dtype=np.float64))
+                model.version = version
+        if model is not None:
+            _write_state(path, model)
+            version = model.version
+    _memo[path] = (version, k, model)
+    return model
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Мотивационные архетипы (мини-пакетный k-means)")
+    parser.add_argument("--k", type=int, default=DEFAULT_K, help="число архетипов")
+    parser.add_argument("--refit", action="store_true", help="обучить заново по всем строкам")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=os.environ.get("RESULTS_BACKEND", "csv"))
+    parser.add_argument("--path", default=os.environ.get("RESULTS_PATH"), help="путь к хранилищу")
+    args = parser.parse_args(argv)
+
+    store = open_store(args.backend, args.path)
+    if args.refit and os.path.exists(_state_path(store)):
+        os.remove(_state_path(store))
+    model = get_model(store, args.k)
+    if model is None:
+        raise SystemExit(f"Недостаточно данных: нужно хотя бы {args.k} результатов")
+    for i, (label, size) in enumerate(zip(model.labels(), model.counts)):
+        print(f"Архетип {i + 1} ({size} чел.): {label}")
+        print("   " + ", ".join(f"{v:.0f}" for v in model.centroids[i]))
+
+
+if __name__ == "__main__":
+    main()
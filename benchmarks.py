@@ -0,0 +1,279 @@
+# benchmarks.py
+# Воспроизводимые замеры горячих путей: подсчёт факторов, запись/чтение
+# результатов на 1k/100k/1M строк, PDF-отчёт, агрегация для группового дашборда
+# поиск похожих профилей, а также холодный старт приложения: импорт
+# streamlit_app и первая отрисовка в новом процессе.
+# Данные синтетические (фиксированный seed), результаты пишутся в JSON,
+# который можно сравнить с прогоном на другом коммите:
+#
+#   python benchmarks.py --output bench_results.json
+#   python benchmarks.py --sizes 1000,10000 --compare bench_results.json
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from aggregates import append_results, get_aggregates
+from report import TEMPLATE_VERSION, _render_pdf, build_pdf_report
+from scoring import (
+    FACTOR_IDS,
+    FACTOR_NAMES,
+    OPTION_LETTERS,
+    POINTS_PER_QUESTION,
+    QUESTIONS,
+    calculate_factors,
+    calculate_factors_batch,
+)
+from similarity import get_index
+from storage import FACTOR_COLUMNS, open_store
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+SEED = 12
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def random_answer_sheets(n, rng):
+    """
+    N корректных бланков формы (N, 33, 4): в каждом вопросе 11 баллов
+    распределены между вариантами (три случайных разреза отрезка 0..11).
+    """
+    cuts = np.sort(rng.integers(0, POINTS_PER_QUESTION + 1, size=(n, len(QUESTIONS), 3)), axis=-1)
+    edges = np.concatenate(
+        [np.zeros((n, len(QUESTIONS), 1), dtype=cuts.dtype), cuts,
+         np.full((n, len(QUESTIONS), 1), POINTS_PER_QUESTION, dtype=cuts.dtype)],
+        axis=-1,
+    )
+    return np.diff(edges, axis=-1).astype(np.uint8)
+
+
+def sheet_to_answers(sheet):
+    """Бланк (33, 4) -> dict {(q_num, option_letter): points}, как в форме."""
+    return {
+        (q["num"], opt): int(sheet[i, j])
+        for i, q in enumerate(QUESTIONS)
+        for j, opt in enumerate(OPTION_LETTERS)
+    }
+
+
+def random_result_rows(n, rng, start=datetime.datetime(2025, 1, 1)):
+    """N строк результатов с баллами, посчитанными из синтетических бланков."""
+    scores = calculate_factors_batch(random_answer_sheets(n, rng)).tolist()
+    names = rng.choice(["Анна", "Иван", "Мария", "Пётр", "Ольга", "Алексей"], size=n)
+    seconds = np.sort(rng.integers(0, 365 * 24 * 3600, size=n))
+    rows = []
+    for name, sec, factor_row in zip(names.tolist(), seconds.tolist(), scores):
+        row = {
+            "timestamp": (start + datetime.timedelta(seconds=sec)).isoformat(timespec="seconds"),
+            "name": name,
+        }
+        for fid, score in zip(FACTOR_IDS, factor_row):
+            row[FACTOR_NAMES[fid]] = score
+        rows.append(row)
+    return rows
+
+
+def measure(fn, repeat=5, number=1):
+    """Время одного вызова fn (сек): минимум, медиана и среднее по repeat замерам."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return _timing(times, repeat, number)
+
+
+def _timing(times, repeat, number):
+    return {
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.fmean(times),
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def bench_scoring(rng):
+    sheets = random_answer_sheets(10_000, rng)
+    answers = sheet_to_answers(sheets[0])
+    yield "calculate_factors", {}, measure(lambda: calculate_factors(answers), number=200)
+    # бланк сессии в компактном виде: массив (33, 4) uint8
+    yield "calculate_factors", {"input": "uint8"}, measure(
+        lambda: calculate_factors(sheets[0]), number=200
+    )
+    yield "calculate_factors_batch", {"n": len(sheets)}, measure(
+        lambda: calculate_factors_batch(sheets), repeat=5
+    )
+
+
+def bench_persistence(rng, sizes, tmpdir):
+    for backend in ("csv", "sqlite"):
+        for n in sizes:
+            path = os.path.join(tmpdir, f"results_{backend}_{n}.{'db' if backend == 'sqlite' else 'csv'}")
+            store = open_store(backend, path)
+            for start in range(0, n, 100_000):
+                store.append(random_result_rows(min(100_000, n - start), rng))
+            get_aggregates(store)  # построить агрегаты до замеров
+
+            extra = iter(random_result_rows(50, rng))
+            params = {"backend": backend, "rows": n}
+            # то же, что делает save_result: дозапись строки + обновление агрегатов
+            yield "save_result", params, measure(
+                lambda: append_results(store, [next(extra)]), repeat=20
+            )
+            yield "load_results", params, measure(store.load, repeat=3)
+            df = store.load()
+            yield "dashboard_mean_pandas", params, measure(
+                lambda: df[FACTOR_COLUMNS].mean(), repeat=5
+            )
+            yield "dashboard_mean_aggregates", params, measure(
+                lambda: get_aggregates(store).total.means(), repeat=20
+            )
+            yield "dashboard_mean_store", params, measure(store.factor_means, repeat=3)
+            # год истории по неделям со скользящим окном — из дневных сумм агрегатов
+            yield "dashboard_trend_aggregates", params, measure(
+                lambda: get_aggregates(store).trend.series("week", window=4), repeat=20
+            )
+            index = get_index(store)
+            query = dict(zip(FACTOR_IDS, index.matrix[0].astype(int).tolist()))
+            yield "similarity_query", params, measure(
+                lambda: index.query(query, k=10, metric="cosine"), repeat=20
+            )
+
+
+def bench_pdf(rng):
+    scores = calculate_factors_batch(random_answer_sheets(1, rng))[0]
+    factor_scores = {fid: int(s) for fid, s in zip(FACTOR_IDS, scores)}
+    key = tuple(sorted(factor_scores.items()))
+
+    yield "build_pdf_report_uncached", {}, measure(
+        lambda: _render_pdf.__wrapped__("Участник", key, TEMPLATE_VERSION), repeat=5
+    )
+    build_pdf_report("Участник", factor_scores)
+    yield "build_pdf_report_cached", {}, measure(
+        lambda: build_pdf_report("Участник", factor_scores), number=1000
+    )
+
+
+_COLD_IMPORT = """
+import time
+start = time.perf_counter()
+import streamlit_app
+print(time.perf_counter() - start)
+"""
+
+_FIRST_RENDER = """
+import sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120).run()
+assert not at.exception, at.exception
+print(time.perf_counter() - start)
+"""
+
+
+def _in_fresh_process(code, args=(), repeat=5, env=None):
+    """Запускает code в новом интерпретаторе repeat раз; код печатает свои секунды."""
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", code, *args], capture_output=True, text=True,
+            check=True, cwd=HERE, env=env,
+        ).stdout
+        times.append(float(out.strip().splitlines()[-1]))
+    return _timing(times, repeat, 1)
+
+
+def bench_startup(tmpdir):
+    """Холодный импорт streamlit_app и первая отрисовка (AppTest) на пустом хранилище."""
+    env = dict(os.environ, RESULTS_BACKEND="csv", RESULTS_PATH=os.path.join(tmpdir, "startup.csv"))
+    yield "cold_import", {}, _in_fresh_process(_COLD_IMPORT, env=env)
+    yield "first_render", {}, _in_fresh_process(
+        _FIRST_RENDER, [os.path.join(HERE, "streamlit_app.py")], env=env
+    )
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=HERE,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes=DEFAULT_SIZES, groups=("scoring", "persistence", "pdf", "startup")):
+    rng = np.random.default_rng(SEED)
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        suites = {
+            "scoring": lambda: bench_scoring(rng),
+            "persistence": lambda: bench_persistence(rng, sizes, tmpdir),
+            "pdf": lambda: bench_pdf(rng),
+            "startup": lambda: bench_startup(tmpdir),
+        }
+        for group in groups:
+            for name, params, timing in suites[group]():
+                entry = {"name": name, "params": params, **timing}
+                results.append(entry)
+                label = ", ".join(f"{k}={v}" for k, v in params.items())
+                print(f"{name:<28} {label:<28} median {timing['median_s'] * 1000:10.3f} ms")
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": SEED,
+        "results": results,
+    }
+
+
+def _key(entry):
+    return entry["name"], json.dumps(entry["params"], sort_keys=True)
+
+
+def compare(current, baseline):
+    """Печатает отношение медиан текущего прогона к базовому (>1 — медленнее)."""
+    base = {_key(e): e for e in baseline["results"]}
+    print(f"\nСравнение с {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    for entry in current["results"]:
+        old = base.get(_key(entry))
+        if old and old["median_s"]:
+            ratio = entry["median_s"] / old["median_s"]
+            label = ", ".join(f"{k}={v}" for k, v in entry["params"].items())
+            print(f"{entry['name']:<28} {label:<28} x{ratio:6.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки горячих путей приложения")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="размеры хранилища для замеров записи/чтения")
+    parser.add_argument("--only", default="scoring,persistence,pdf,startup", help="какие группы запускать")
+    parser.add_argument("--output", default="bench_results.json", help="куда записать JSON")
+    parser.add_argument("--compare", default=None, help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args(argv)
+
+    report = run(
+        sizes=[int(s) for s in args.sizes.split(",") if s],
+        groups=[g for g in args.only.split(",") if g],
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты: {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# bulk_reports.py
+# Массовая генерация индивидуальных PDF-отчётов по сохранённым результатам.
+# PDF рендерятся в пуле процессов и по мере готовности пишутся в ZIP-архив;
+# число задач «в полёте» ограничено, поэтому память не растёт с размером выборки.
+#
+#   python bulk_reports.py reports.zip --backend sqlite --name-prefix Ив
+
+import argparse
+import collections
+import concurrent.futures as cf
+import os
+import re
+import time
+import zipfile
+
+from aggregates import get_aggregates
+from report import build_pdf_report
+from scoring import FACTOR_IDS
+from storage import BACKENDS, FACTOR_COLUMNS, open_store
+
+
+def _render(task):
+    """Выполняется в дочернем процессе: (индекс, имя, баллы, перцентили) -> (индекс, имя, PDF, сек)."""
+    idx, name, scores, percentiles = task
+    start = time.perf_counter()
+    pdf_bytes = build_pdf_report(name, dict(zip(FACTOR_IDS, scores)), percentiles)
+    return idx, name, pdf_bytes, time.perf_counter() - start
+
+
+def _iter_tasks(store, **filters):
+    # перцентили — относительно всей группы, по гистограммам из агрегатов
+    hist = get_aggregates(store).hist
+    idx = 0
+    for chunk in store.iter_chunks(**filters):
+        names = chunk["name"].astype(str).tolist()
+        scores = chunk[FACTOR_COLUMNS].astype(int).to_numpy().tolist()
+        for name, row in zip(names, scores):
+            idx += 1
+            yield idx, name, tuple(row), hist.percentiles(dict(zip(FACTOR_IDS, row)))
+
+
+def _arcname(idx, name):
+    safe = re.sub(r"[^\w\-]+", "_", name).strip("_") or "participant"
+    return f"{idx:06d}_{safe}.pdf"
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с шагом 1 мс: память не зависит от числа отчётов."""
+
+    def __init__(self):
+        self.buckets = collections.Counter()
+        self.count = 0
+
+    def add(self, seconds):
+        self.buckets[int(seconds * 1000)] += 1
+        self.count += 1
+
+    def percentile(self, q):
+        """Верхняя граница корзины (в мс), в которую попадает q-й процентиль."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for ms in sorted(self.buckets):
+            seen += self.buckets[ms]
+            if seen >= rank:
+                return float(ms + 1)
+        return float(max(self.buckets) + 1)
+
+
+def generate_reports(store, output, workers=None, max_in_flight=None, **filters):
+    """
+    Рендерит PDF для всех строк хранилища (с учётом фильтров) в ZIP-архив.
+    Возвращает dict со статистикой: число отчётов, время, отчётов/сек, p50/p95/p99.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 4
+    latencies = LatencyHistogram()
+    start = time.perf_counter()
+
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as zf, \
+            cf.ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+
+        def drain(return_when):
+            nonlocal pending
+            done, pending = cf.wait(pending, return_when=return_when)
+            for fut in done:
+                idx, name, pdf_bytes, seconds = fut.result()
+                zf.writestr(_arcname(idx, name), pdf_bytes)
+                latencies.add(seconds)
+
+        for task in _iter_tasks(store, **filters):
+            if len(pending) >= max_in_flight:
+                drain(cf.FIRST_COMPLETED)
+            pending.add(pool.submit(_render, task))
+        if pending:
+            drain(cf.ALL_COMPLETED)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "reports": latencies.count,
+        "seconds": elapsed,
+        "reports_per_sec": latencies.count / elapsed if elapsed else 0.0,
+        "p50_ms": latencies.percentile(50),
+        "p95_ms": latencies.percentile(95),
+        "p99_ms": latencies.percentile(99),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PDF-отчёты по всем сохранённым результатам")
+    parser.add_argument("output", help="путь к ZIP-архиву")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=os.environ.get("RESULTS_BACKEND", "csv"))
+    parser.add_argument("--path", default=os.environ.get("RESULTS_PATH"), help="путь к хранилищу")
+    parser.add_argument("--name-prefix", default=None, help="только имена с этим началом")
+    parser.add_argument("--since", default=None, help="не раньше даты (ISO)")
+    parser.add_argument("--until", default=None, help="раньше даты (ISO)")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="лимит задач в очереди")
+    args = parser.parse_args(argv)
+
+    stats = generate_reports(
+        open_store(args.backend, args.path),
+        args.output,
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        name_prefix=args.name_prefix,
+        since=args.since,
+        until=args.until,
+    )
+    print(
+        f"Отчётов: {stats['reports']} за {stats['seconds']:.1f} с "
+        f"({stats['reports_per_sec']:.1f} отчётов/с); задержка на отчёт "
+        f"p50={stats['p50_ms']:.0f} мс, p95={stats['p95_ms']:.0f} мс, "
+        f"p99={stats['p99_ms']:.0f} мс"
+    )
+
+
+if __name__ == "__main__":
+    main()
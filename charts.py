@@ -0,0 +1,283 @@
+# charts.py
+# Радарная и столбчатая диаграммы профиля, распределение уровней по факторам,
+# динамика средних по периодам.
+# Plotly-фигуры кэшируются по кортежу баллов; для слабых каналов и для PDF
+# есть статический путь — PNG, нарисованный через Pillow (тоже с кэшем).
+
+import functools
+import io
+import math
+import os
+
+import plotly.graph_objects as go
+from PIL import Image, ImageDraw, ImageFont
+
+from scoring import FACTOR_NAMES
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Roboto-Regular.ttf")
+FIGURE_CACHE_SIZE = 512
+IMAGE_CACHE_SIZE = 256
+
+_FILL = (99, 110, 250)  # цвет трассы Plotly по умолчанию
+_GRID = (210, 210, 210)
+_TEXT = (40, 40, 40)
+
+
+def score_key(factor_scores):
+    """Ключ кэша: кортеж (factor_id, score), отсортированный по id."""
+    return tuple(sorted(factor_scores.items()))
+
+
+@functools.lru_cache(maxsize=FIGURE_CACHE_SIZE)
+def radar_figure(scores, title):
+    """scores: кортеж из score_key(). Возвращает go.Figure (не изменять)."""
+    labels = [FACTOR_NAMES[fid] for fid, _ in scores]
+    values = [score for _, score in scores]
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatterpolar(
+        r=values + [values[0]],
+        theta=labels + [labels[0]],
+        fill="toself",
+        name="Профиль",
+    ))
+    fig.update_layout(
+        polar=dict(
+            radialaxis=dict(visible=True)
+        ),
+        showlegend=False,
+        title=title,
+        margin=dict(l=40, r=40, t=60, b=40),
+    )
+    return fig
+
+
+@functools.lru_cache(maxsize=FIGURE_CACHE_SIZE)
+def radar_multi_figure(profiles, title):
+    """profiles: кортеж (подпись, кортеж из score_key()). Несколько профилей на одной диаграмме."""
+    fig = go.Figure()
+    for name, scores in profiles:
+        labels = [FACTOR_NAMES[fid] for fid, _ in scores]
+        values = [score for _, score in scores]
+        fig.add_trace(go.Scatterpolar(
+            r=values + [values[0]],
+            theta=labels + [labels[0]],
+            fill="toself",
+            opacity=0.55,
+            name=name,
+        ))
+    fig.update_layout(
+        polar=dict(
+            radialaxis=dict(visible=True)
+        ),
+        title=title,
+        margin=dict(l=40, r=40, t=60, b=40),
+    )
+    return fig
+
+
+@functools.lru_cache(maxsize=FIGURE_CACHE_SIZE)
+def bar_figure(scores, title):
+    """scores: кортеж из score_key(). Возвращает go.Figure (не изменять)."""
+    labels = [FACTOR_NAMES[fid] for fid, _ in scores]
+    values = [score for _, score in scores]
+    fig = go.Figure(
+        data=[go.Bar(x=labels, y=values)]
+    )
+    fig.update_layout(
+        title=title,
+        xaxis_tickangle=-45,
+        margin=dict(l=40, r=40, t=60, b=120),
+    )
+    return fig
+
+
+@functools.lru_cache(maxsize=FIGURE_CACHE_SIZE)
+def trend_figure(periods, series, title):
+    """
+    Линии средних по периодам: periods — кортеж подписей периодов, series —
+    кортеж (factor_id, кортеж значений; None — нет ответов).
+    Возвращает go.Figure (не изменять).
+    """
+    fig = go.Figure(data=[
+        go.Scatter(x=list(periods), y=list(values), mode="lines+markers", name=FACTOR_NAMES[fid])
+        for fid, values in series
+    ])
+    fig.update_layout(
+        title=title,
+        yaxis_title="Средний балл",
+        legend=dict(orientation="h", y=-0.2),
+        margin=dict(l=40, r=40, t=60, b=40),
+    )
+    return fig
+
+
+@functools.lru_cache(maxsize=None)
+def _font(size):
+    return ImageFont.truetype(FONT_PATH, size)
+
+
+def _nice_max(value):
+    """Верхняя граница шкалы: ближайшее сверху «круглое» число."""
+    if value <= 0:
+        return 10
+    step = 10 ** int(math.log10(value))
+    return int(math.ceil(value / step) * step)
+
+
+def _png(img):
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+@functools.lru_cache(maxsize=IMAGE_CACHE_SIZE)
+def radar_png(scores, title, size=640):
+    """Статическая радарная диаграмма (PNG); оси подписаны номерами факторов."""
+    img = Image.new("RGB", (size, size), "white")
+    draw = ImageDraw.Draw(img)
+    draw.text((size // 2, 16), title, font=_font(size // 28), fill=_TEXT, anchor="mt")
+
+    cx, cy = size / 2, size / 2 + size / 24
+    radius = size * 0.36
+    top = _nice_max(max((s for _, s in scores), default=0))
+    n = len(scores)
+    angles = [math.pi / 2 - 2 * math.pi * i / n for i in range(n)]
+
+    def point(r, angle):
+        return cx + r * math.cos(angle), cy - r * math.sin(angle)
+
+    for ring in (0.25, 0.5, 0.75, 1.0):
+        draw.polygon([point(radius * ring, a) for a in angles], outline=_GRID)
+        draw.text(point(radius * ring, math.pi / 2), str(round(top * ring)),
+                  font=_font(size // 48), fill=(130, 130, 130), anchor="lb")
+    for (fid, _), angle in zip(scores, angles):
+        draw.line([(cx, cy), point(radius, angle)], fill=_GRID)
+        draw.text(point(radius + size / 22, angle), str(fid),
+                  font=_font(size // 34), fill=_TEXT, anchor="mm")
+
+    overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
+    shape = [point(radius * min(score, top) / top, a) for (_, score), a in zip(scores, angles)]
+    ImageDraw.Draw(overlay).polygon(shape, fill=_FILL + (90,), outline=_FILL + (255,))
+    img.paste(overlay, mask=overlay)
+    return _png(img)
+
+
+@functools.lru_cache(maxsize=IMAGE_CACHE_SIZE)
+def bar_png(scores, title, width=900):
+    """Статическая горизонтальная столбчатая диаграмма (PNG) с названиями факторов."""
+    row_h = width // 28
+    label_w = int(width * 0.5)
+    height = row_h * (len(scores) + 2)
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    draw.text((width // 2, row_h // 3), title, font=_font(width // 40), fill=_TEXT, anchor="mt")
+
+    top = _nice_max(max((s for _, s in scores), default=0))
+    bar_w = width - label_w - width // 12
+    font = _font(int(row_h * 0.5))
+    for i, (fid, score) in enumerate(scores):
+        y = row_h * (i + 1.5)
+        draw.text((label_w - 10, y), FACTOR_NAMES[fid], font=font, fill=_TEXT, anchor="rm")
+        length = bar_w * min(score, top) / top
+        draw.rectangle([label_w, y - row_h * 0.35, label_w + length, y + row_h * 0.35], fill=_FILL)
+        draw.text((label_w + length + 6, y), str(round(score, 1)), font=font, fill=_TEXT, anchor="lm")
+    return _png(img)
+
+
+_LEVEL_COLORS = ((200, 205, 250), (140, 150, 250), (70, 80, 220))  # низкий, средний, высокий
+
+
+@functools.lru_cache(maxsize=IMAGE_CACHE_SIZE)
+def levels_png(shares, title, labels=("низкий", "средний", "высокий"), width=900):
+    """
+    Распределение уровней по факторам (PNG): shares — кортеж
+    (factor_id, (доли уровней)), доли в сумме 1; полоса на фактор.
+    """
+    row_h = width // 28
+    label_w = int(width * 0.5)
+    height = row_h * (len(shares) + 3)
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    draw.text((width // 2, row_h // 3), title, font=_font(width // 40), fill=_TEXT, anchor="mt")
+
+    bar_w = width - label_w - width // 24
+    font = _font(int(row_h * 0.5))
+    for i, (fid, parts) in enumerate(shares):
+        y = row_h * (i + 1.5)
+        draw.text((label_w - 10, y), FACTOR_NAMES[fid], font=font, fill=_TEXT, anchor="rm")
+        x = label_w
+        for share, color in zip(parts, _LEVEL_COLORS):
+            length = bar_w * share
+            draw.rectangle([x, y - row_h * 0.35, x + length, y + row_h * 0.35], fill=color)
+            if share >= 0.08:
+                draw.text((x + length / 2, y), f"{share:.0%}", font=font,
+                          fill="white" if color == _LEVEL_COLORS[-1] else _TEXT, anchor="mm")
+            x += length
+
+    y = row_h * (len(shares) + 2)
+    x = label_w
+    for label, color in zip(labels, _LEVEL_COLORS):
+        draw.rectangle([x, y - row_h * 0.25, x + row_h * 0.5, y + row_h * 0.25], fill=color)
+        draw.text((x + row_h * 0.7, y), label, font=font, fill=_TEXT, anchor="lm")
+        x += bar_w // 3
+    return _png(img)
+
+
+# цвета линий статической динамики (палитра Plotly по умолчанию)
+_LINE_COLORS = (
+    (99, 110, 250), (239, 85, 59), (0, 204, 150), (171, 99, 250), (255, 161, 90), (25, 211, 243),
+    (255, 102, 146), (182, 232, 128), (255, 151, 255), (254, 203, 82), (120, 120, 120), (40, 40, 40),
+)
+
+
+@functools.lru_cache(maxsize=IMAGE_CACHE_SIZE)
+def trend_png(periods, series, title, width=900):
+    """Статический вариант trend_figure (PNG): линии по периодам и легенда под графиком."""
+    font = _font(width // 64)
+    plot_h = width // 2
+    left, right, top_y = width // 10, width - width // 16, width // 14
+    legend_rows = -(-len(series) // 2)
+    height = top_y + plot_h + width // 20 + legend_rows * (width // 36) + width // 40
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    draw.text((width // 2, width // 60), title, font=_font(width // 40), fill=_TEXT, anchor="mt")
+
+    values = [v for _, vals in series for v in vals if v is not None]
+    top = _nice_max(max(values, default=0))
+    bottom = top_y + plot_h
+    for ring in (0, 0.25, 0.5, 0.75, 1.0):
+        y = bottom - plot_h * ring
+        draw.line([(left, y), (right, y)], fill=_GRID)
+        draw.text((left - 6, y), str(round(top * ring)), font=font, fill=_TEXT, anchor="rm")
+
+    n = len(periods)
+    step = (right - left) / max(n - 1, 1)
+
+    def x_of(i):
+        return left + step * i if n > 1 else (left + right) / 2
+
+    every = max(1, -(-n // 8))
+    for i in range(0, n, every):
+        draw.text((x_of(i), bottom + 6), str(periods[i]), font=font, fill=_TEXT, anchor="mt")
+
+    for k, (fid, vals) in enumerate(series):
+        color = _LINE_COLORS[k % len(_LINE_COLORS)]
+        # линия прерывается на периодах без ответов
+        segment = []
+        for i, v in enumerate(list(vals) + [None]):
+            if v is None:
+                if len(segment) > 1:
+                    draw.line(segment, fill=color, width=2)
+                elif segment:
+                    x, y = segment[0]
+                    draw.ellipse([x - 2, y - 2, x + 2, y + 2], fill=color)
+                segment = []
+            else:
+                segment.append((x_of(i), bottom - plot_h * min(v, top) / top))
+
+        y = bottom + width // 20 + (k // 2) * (width // 36)
+        x = left + (k % 2) * (width - left) // 2
+        draw.line([(x, y), (x + width // 30, y)], fill=color, width=3)
+        draw.text((x + width // 25, y), FACTOR_NAMES[fid], font=font, fill=_TEXT, anchor="lm")
+    return _png(img)
@@ -0,0 +1,174 @@
+# columnar.py
+# Компактное колоночное представление результатов.
+# В памяти: баллы факторов — uint8/uint16, имя и прочие текстовые столбцы —
+# category, timestamp — datetime. На диске: снимок results.csv в формате
+# Arrow IPC (<csv>.arrow) без сжатия, который читается через memory map;
+# строки, дописанные в CSV после снимка, дочитываются из «хвоста» файла.
+#
+#   python columnar.py results.csv
+
+import argparse
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from scoring import FACTOR_IDS, FACTOR_NAMES, MAX_FACTOR_SCORES
+from storage import COHORT_DTYPES
+
+SNAPSHOT_SUFFIX = ".arrow"
+FACTOR_DTYPE = np.uint8 if max(MAX_FACTOR_SCORES.values()) <= 255 else np.uint16
+_FACTOR_COLUMNS = [FACTOR_NAMES[fid] for fid in FACTOR_IDS]
+# сколько последних байт CSV перед смещением снимка сверяется при чтении
+_TAIL_CHECK = 64
+
+
+def compact_frame(df):
+    """Приводит DataFrame результатов к компактным типам столбцов."""
+    df = df.copy()
+    for col in df.columns:
+        if col in _FACTOR_COLUMNS:
+            df[col] = df[col].astype(FACTOR_DTYPE)
+        elif col == "timestamp":
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+        elif not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    return df
+
+
+def _to_table(df):
+    arrays, fields = [], []
+    for col in df.columns:
+        if col in _FACTOR_COLUMNS:
+            typ = pa.from_numpy_dtype(FACTOR_DTYPE)
+            arr = pa.array(df[col].to_numpy(dtype=FACTOR_DTYPE), typ)
+        elif col == "timestamp":
+            typ = pa.timestamp("s")
+            arr = pa.array(pd.to_datetime(df[col], errors="coerce"), typ)
+        else:
+            typ = pa.string()
+            # пропуски (пустые атрибуты подгруппы) остаются null, а не "nan"
+            values = df[col].astype(object).where(df[col].notna(), None).tolist()
+            arr = pa.array([None if v is None else str(v) for v in values], typ)
+        arrays.append(arr)
+        fields.append(pa.field(col, typ))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+class _Head(io.RawIOBase):
+    """Поток, отдающий не больше limit байт из открытого файла."""
+
+    def __init__(self, f, limit):
+        self._f = f
+        self._left = limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._f.read(min(len(b), self._left))
+        self._left -= len(data)
+        b[:len(data)] = data
+        return len(data)
+
+
+def _read_tail_check(f, offset):
+    f.seek(max(0, offset - _TAIL_CHECK))
+    return f.read(min(offset, _TAIL_CHECK)).hex()
+
+
+def snapshot_path(csv_path):
+    return csv_path + SNAPSHOT_SUFFIX
+
+
+def convert_csv(csv_path, out_path=None, chunksize=100_000):
+    """
+    Конвертирует results.csv в снимок Arrow IPC порциями (память — одна порция).
+    Читается только то, что было в файле на момент начала: CSV дописывается
+    целыми строками, и этот префикс уже не меняется. Возвращает число строк.
+    """
+    out_path = out_path or snapshot_path(csv_path)
+    source_size = os.path.getsize(csv_path)
+    rows = 0
+    tmp = out_path + ".tmp"
+    with open(csv_path, "rb") as f:
+        tail_check = _read_tail_check(f, source_size)
+        f.seek(0)
+        head = io.BufferedReader(_Head(f, source_size))
+        writer = None
+        try:
+            for chunk in pd.read_csv(head, chunksize=chunksize, encoding="utf-8", dtype=COHORT_DTYPES):
+                table = _to_table(chunk)
+                if writer is None:
+                    schema = table.schema.with_metadata({
+                        "source_size": str(source_size),
+                        "source_tail": tail_check,
+                    })
+                    writer = ipc.new_file(tmp, schema)
+                writer.write_table(table.replace_schema_metadata(schema.metadata))
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+    if writer is None:
+        return 0
+    os.replace(tmp, out_path)
+    return rows
+
+
+def read_snapshot(path, columns=None):
+    """
+    Открывает снимок через memory map: числовые столбцы не копируются,
+    а невостребованные столбцы не читаются с диска.
+    Возвращает (DataFrame, метаданные снимка).
+    """
+    # источник не закрываем явно: буферы таблицы ссылаются на отображённую память
+    table = ipc.open_file(pa.memory_map(path, "r")).read_all()
+    meta = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+    if columns is not None:
+        table = table.select([c for c in columns if c in table.column_names])
+    df = table.to_pandas(strings_to_categorical=True)
+    return df, meta
+
+
+def load_csv_compact(csv_path, columns):
+    """
+    Загружает results.csv в компактных типах. Если рядом есть актуальный
+    снимок Arrow, читает его через memory map и дочитывает из CSV только
+    строки, дописанные после снимка.
+    """
+    snap = snapshot_path(csv_path)
+    size = os.path.getsize(csv_path)
+    if os.path.exists(snap):
+        df, meta = read_snapshot(snap)
+        offset = int(meta.get("source_size", -1))
+        with open(csv_path, "rb") as f:
+            fresh = 0 < offset <= size and _read_tail_check(f, offset) == meta.get("source_tail")
+            if fresh and list(df.columns) == list(columns):
+                if size == offset:
+                    return df
+                f.seek(offset)
+                tail = pd.read_csv(
+                    io.BufferedReader(_Head(f, size - offset)),
+                    header=None, names=columns, encoding="utf-8", dtype=COHORT_DTYPES,
+                )
+                df = pd.concat([df, compact_frame(tail)], ignore_index=True)
+                return compact_frame(df)
+    return compact_frame(pd.read_csv(csv_path, dtype=COHORT_DTYPES))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Снимок results.csv в колоночном формате Arrow")
+    parser.add_argument("csv_path", nargs="?", default="results.csv")
+    parser.add_argument("--output", default=None, help="по умолчанию <csv_path>.arrow")
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    args = parser.parse_args(argv)
+    n = convert_csv(args.csv_path, args.output, args.chunksize)
+    print(f"Снимок: {n} строк -> {args.output or snapshot_path(args.csv_path)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+# export.py
+# Выгрузка групповых результатов в CSV, XLSX и ZIP (CSV + сводка + описание).
+# Строки читаются из хранилища порциями (store.iter_chunks) и сразу пишутся
+# в файл, поэтому память не зависит от числа строк. Фильтры — те же, что на
+# дашборде. Большие выгрузки (больше BACKGROUND_ROWS строк) готовятся во
+# временный файл в фоновом потоке (start_export).
+#
+# XLSX пишется через openpyxl (режим write_only); пакет импортируется при
+# первой выгрузке в XLSX, а не при старте приложения.
+#
+#   python export.py results.xlsx --name-prefix Ив --faculty ФЭН
+
+import argparse
+import atexit
+import concurrent.futures as cf
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+
+from aggregates import FactorStats
+from scoring import FACTOR_IDS, FACTOR_NAMES
+from storage import BACKENDS, FACTOR_COLUMNS, RESULT_COLUMNS, open_store
+
+CHUNKSIZE = 50_000
+BACKGROUND_ROWS = 50_000  # больше строк — файл готовится в фоне
+XLSX_MAX_ROWS = 1_048_575  # строк данных на лист Excel (без заголовка)
+JOB_TTL = 3600  # сколько хранить готовый файл фоновой выгрузки, секунды
+
+FORMATS = {
+    "csv": ("CSV", "text/csv"),
+    "xlsx": ("Excel (XLSX)", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "zip": ("ZIP (CSV + сводка)", "application/zip"),
+}
+
+
+def file_name(fmt, prefix="results"):
+    return f"{prefix}_{datetime.date.today().isoformat()}.{fmt}"
+
+
+def _chunks(store, chunksize=CHUNKSIZE, **filters):
+    for chunk in store.iter_chunks(chunksize=chunksize, **filters):
+        yield chunk.reindex(columns=RESULT_COLUMNS)
+
+
+def write_csv(store, f, **filters):
+    """Пишет CSV в открытый бинарный файл; возвращает число строк."""
+    text = io.TextIOWrapper(f, encoding="utf-8", newline="", write_through=True)
+    try:
+        csv.writer(text, lineterminator="\n").writerow(RESULT_COLUMNS)
+        total = 0
+        for chunk in _chunks(store, **filters):
+            chunk.to_csv(text, index=False, header=False, lineterminator="\n")
+            total += len(chunk)
+        text.flush()
+    finally:
+        text.detach()  # файл закрывает вызывающий
+    return total
+
+
+def write_xlsx(store, f, **filters):
+    """
+    Пишет XLSX потоково (openpyxl write_only); строки сверх лимита листа
+    Excel переносятся на следующие листы. Возвращает число строк.
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    sheet, sheet_rows, sheets, total = None, XLSX_MAX_ROWS, 0, 0
+    for chunk in _chunks(store, **filters):
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            if sheet_rows == XLSX_MAX_ROWS:
+                sheets += 1
+                sheet = wb.create_sheet("results" if sheets == 1 else f"results_{sheets}")
+                sheet.append(RESULT_COLUMNS)
+                sheet_rows = 0
+            sheet.append(row)
+            sheet_rows += 1
+        total += len(chunk)
+    if sheet is None:
+        wb.create_sheet("results").append(RESULT_COLUMNS)
+    wb.save(f)
+    return total
+
+
+def _summary_rows(stats):
+    means, stds = stats.means(), stats.stds()
+    yield ["factor_id", "factor", "count", "mean", "std", "min", "max"]
+    for i, fid in enumerate(FACTOR_IDS):
+        if not stats.count:
+            break
+        yield [
+            fid, FACTOR_NAMES[fid], stats.count, round(means[fid], 2), round(stds[fid], 2),
+            stats.mins[i], stats.maxs[i],
+        ]
+
+
+def write_zip(store, f, **filters):
+    """
+    ZIP-пакет: results.csv (потоково), summary.csv — статистика факторов
+    по выгруженным строкам, export.json — фильтры и число строк.
+    """
+    stats = FactorStats()
+    with zipfile.ZipFile(f, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        with zf.open("results.csv", "w", force_zip64=True) as member:
+            text = io.TextIOWrapper(member, encoding="utf-8", newline="")
+            csv.writer(text, lineterminator="\n").writerow(RESULT_COLUMNS)
+            for chunk in _chunks(store, **filters):
+                chunk.to_csv(text, index=False, header=False, lineterminator="\n")
+                stats.add_batch(chunk[FACTOR_COLUMNS].to_numpy(dtype="int64"))
+            text.flush()
+            text.detach()
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\n").writerows(_summary_rows(stats))
+        zf.writestr("summary.csv", buf.getvalue())
+        zf.writestr("export.json", json.dumps({
+            "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "filters": {k: v for k, v in filters.items() if v},
+            "rows": stats.count,
+            "columns": RESULT_COLUMNS,
+        }, ensure_ascii=False, indent=2))
+    return stats.count
+
+
+WRITERS = {"csv": write_csv, "xlsx": write_xlsx, "zip": write_zip}
+
+
+def export(store, fmt, path, **filters):
+    """Выгружает результаты в файл path; возвращает число строк."""
+    with open(path, "wb") as f:
+        return WRITERS[fmt](store, f, **filters)
+
+
+def export_bytes(store, fmt, **filters):
+    """Небольшая выгрузка целиком в памяти (для download_button)."""
+    buf = io.BytesIO()
+    WRITERS[fmt](store, buf, **filters)
+    return buf.getvalue()
+
+
+class ExportJob:
+    """Фоновая выгрузка во временный файл: future завершается путём к файлу."""
+
+    def __init__(self, fmt, filters, future, path):
+        self.fmt = fmt
+        self.filters = filters
+        self.future = future
+        self.path = path
+        self.started = time.monotonic()
+        self.served = False
+
+    def matches(self, fmt, filters):
+        return self.fmt == fmt and self.filters == filters
+
+    def expired(self, ttl=JOB_TTL):
+        return time.monotonic() - self.started > ttl
+
+    def read(self):
+        """
+        Содержимое готового файла (читается по нажатию кнопки скачивания);
+        после чтения файл можно удалять (served).
+        """
+        with open(self.future.result(), "rb") as f:
+            data = f.read()
+        self.served = True
+        return data
+
+    def discard(self):
+        """Отменяет выгрузку (если ещё не началась) и удаляет файл."""
+        self.future.cancel()
+        self.future.add_done_callback(lambda _: _remove(self.path))
+
+
+_pool = cf.ThreadPoolExecutor(max_workers=2, thread_name_prefix="export")
+_files = {}  # путь временного файла -> ExportJob
+_files_lock = threading.Lock()
+
+
+def _remove(path):
+    with _files_lock:
+        _files.pop(path, None)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _run(store, fmt, path, filters):
+    try:
+        export(store, fmt, path, **filters)
+    except BaseException:
+        _remove(path)
+        raise
+    return path
+
+
+def start_export(store, fmt, **filters):
+    """Запускает выгрузку во временный файл в фоновом потоке; возвращает ExportJob."""
+    expire_jobs()
+    fd, path = tempfile.mkstemp(prefix="motivation_export_", suffix=f".{fmt}")
+    os.close(fd)
+    with _files_lock:
+        _files[path] = None  # до submit: _run может удалить файл сразу при ошибке
+    job = ExportJob(fmt, dict(filters), _pool.submit(_run, store, fmt, path, filters), path)
+    with _files_lock:
+        if path in _files:
+            _files[path] = job
+    return job
+
+
+def expire_jobs(ttl=JOB_TTL):
+    """Удаляет файлы выгрузок старше ttl (в том числе брошенных сессиями)."""
+    with _files_lock:
+        jobs = [job for job in _files.values() if job is not None and job.expired(ttl)]
+    for job in jobs:
+        job.discard()
+
+
+@atexit.register
+def _cleanup():
+    _pool.shutdown(wait=False, cancel_futures=True)
+    with _files_lock:
+        paths = list(_files)
+    for path in paths:
+        _remove(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Выгрузка групповых результатов (CSV/XLSX/ZIP)")
+    parser.add_argument("output", help="файл .csv, .xlsx или .zip")
+    parser.add_argument("--format", choices=sorted(FORMATS), default=None, help="по умолчанию — по расширению")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=os.environ.get("RESULTS_BACKEND", "csv"))
+    parser.add_argument("--path", default=os.environ.get("RESULTS_PATH"), help="путь к хранилищу")
+    parser.add_argument("--name-prefix", default=None, help="только имена с этим началом")
+    parser.add_argument("--since", default=None, help="не раньше даты (ISO)")
+    parser.add_argument("--until", default=None, help="раньше даты (ISO)")
+    parser.add_argument("--faculty", default=None)
+    parser.add_argument("--level", default=None)
+    parser.add_argument("--instrument", default=None, help="версия опросника")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip(".").lower()
+    if fmt not in FORMATS:
+        parser.error(f"неизвестный формат: {fmt!r}; укажите --format")
+    filters = {
+        key: getattr(args, key)
+        for key in ("name_prefix", "since", "until", "faculty", "level", "instrument")
+    }
+    n = export(open_store(args.backend, args.path), fmt, args.output, **filters)
+    print(f"Выгружено строк: {n} -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
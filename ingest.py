@@ -0,0 +1,249 @@
+# ingest.py
+# Потоковая загрузка «сырых» бланков ответов (33×4 балла) из CSV или JSONL.
+# Конвейер из генераторов: разбор -> проверка сумм по вопросам -> подсчёт
+# факторов через scoring -> пакетная запись в хранилище результатов.
+# В памяти одновременно находится не больше одной порции строк.
+#
+# Формат строки: name, timestamp, faculty, level, instrument (четыре последних
+# необязательны) и столбцы q1_a ... q33_d (как ключи полей формы). В JSONL вместо
+# q*_* можно передать "answers": [[a, b, c, d], ...] — 33 списка по 4 числа.
+# instrument — версия опросника (instruments/<версия>.json), по ключу которой
+# считаются факторы; без неё берётся версия из --instrument.
+#
+#   python ingest.py sheets.csv --rejects rejects.csv
+
+import argparse
+import csv
+import datetime
+import functools
+import itertools
+import json
+import os
+
+import numpy as np
+
+from aggregates import append_results
+from instruments import DEFAULT_VERSION, available_versions, load_plan
+from scoring import FACTOR_NAMES, question_sums
+from storage import BACKENDS, COHORT_COLUMNS, INSTRUMENT_COLUMN, open_store
+
+REJECT_COLUMNS = ["line", "reason", "record"]
+# допустимые даты прохождения: раньше — явная опечатка, позже — «завтра» с запасом на часовой пояс
+EARLIEST_TIMESTAMP = datetime.datetime(2000, 1, 1)
+FUTURE_SLACK = datetime.timedelta(days=1)
+
+
+def read_records(path):
+    """Разбор: (номер строки, dict) для CSV или JSONL (по расширению файла)."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield line_no, {"_raw": line.rstrip("\n"), "_error": f"некорректный JSON: {e}"}
+                    continue
+                if not isinstance(record, dict):
+                    record = {"_raw": line.rstrip("\n"), "_error": "ожидается JSON-объект"}
+                yield line_no, record
+        else:
+            # строка 1 — заголовок
+            for line_no, record in enumerate(csv.DictReader(f), start=2):
+                yield line_no, record
+
+
+@functools.lru_cache(maxsize=None)
+def answer_columns(plan):
+    """Столбцы q1_a ... q33_d в порядке вопросов и вариантов плана."""
+    return [f"q{q['num']}_{opt}" for q in plan.questions for opt in plan.option_letters]
+
+
+ANSWER_COLUMNS = answer_columns(load_plan(DEFAULT_VERSION))
+
+
+def parse_timestamp(value):
+    """
+    Дата прохождения в ISO-формате (пусто — текущее время). Бросает ValueError,
+    если дата не разбирается или лежит вне EARLIEST_TIMESTAMP .. завтра:
+    одна такая дата растянула бы график трендов на десятки тысяч пустых дней.
+    """
+    value = str(value or "").strip()
+    if not value:
+        return datetime.datetime.now().isoformat(timespec="seconds")
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"timestamp: не дата ISO ({value!r})") from None
+    if parsed.tzinfo is not None:
+        # в хранилище — местное время без пояса, как у записей из формы
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    if not EARLIEST_TIMESTAMP <= parsed <= datetime.datetime.now() + FUTURE_SLACK:
+        raise ValueError(f"timestamp: дата {value} вне диапазона")
+    return parsed.isoformat(timespec="seconds")
+
+
+def parse_sheet(record, plan):
+    """
+    Приводит запись к (name, timestamp, список из 132 баллов) по вопросам плана.
+    Бросает ValueError с причиной, если запись не разбирается.
+    """
+    if "_error" in record:
+        raise ValueError(record["_error"])
+    questions, letters, points_max = plan.questions, plan.option_letters, plan.points_per_question
+    columns = answer_columns(plan)
+    name = str(record.get("name") or "").strip()
+    if not name:
+        raise ValueError("не указано имя")
+    timestamp = parse_timestamp(record.get("timestamp"))
+
+    if "answers" in record:
+        answers = record["answers"]
+        if (
+            not isinstance(answers, list)
+            or len(answers) != len(questions)
+            or any(not isinstance(a, list) or len(a) != len(letters) for a in answers)
+        ):
+            raise ValueError(f"answers: ожидается {len(questions)} списков по {len(letters)} числа")
+        values = [v for a in answers for v in a]
+    else:
+        missing = [col for col in columns if col not in record]
+        if missing:
+            raise ValueError(f"нет столбцов: {', '.join(missing[:5])}" + ("..." if len(missing) > 5 else ""))
+        values = [record[col] for col in columns]
+
+    points = []
+    for col, v in zip(columns, values):
+        try:
+            p = int(str(v).strip() or 0)
+        except ValueError:
+            raise ValueError(f"{col}: не целое число ({v!r})") from None
+        if not 0 <= p <= points_max:
+            raise ValueError(f"{col}: значение {p} вне диапазона 0–{points_max}")
+        points.append(p)
+    return name, timestamp, points
+
+
+def parse_stage(records, reject, instrument=DEFAULT_VERSION):
+    """
+    Отдаёт неразбираемые записи в reject(...), пропускает дальше разобранные
+    вместе с планом подсчёта их версии опросника.
+    """
+    for line_no, record in records:
+        try:
+            plan = load_plan(str(record.get(INSTRUMENT_COLUMN) or "").strip() or instrument)
+            name, timestamp, points = parse_sheet(record, plan)
+        except ValueError as e:  # в том числе InstrumentError
+            reject(line_no, str(e), record)
+            continue
+        yield line_no, record, name, timestamp, points, plan
+
+
+def chunked(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def score_stage(sheets, reject, chunksize):
+    """
+    Проверяет суммы по вопросам (правило формы: ровно 11 баллов на вопрос)
+    и считает факторы одним матричным умножением на каждую версию опросника
+    в порции. Выдаёт порции готовых строк результатов.
+    """
+    for chunk in chunked(sheets, chunksize):
+        rows = []
+        by_plan = {}
+        for sheet in chunk:
+            by_plan.setdefault(sheet[5], []).append(sheet)
+        for plan, sheets_ in by_plan.items():
+            rows += _score_plan_chunk(plan, sheets_, reject)
+        if rows:
+            yield rows
+
+
+def _score_plan_chunk(plan, chunk, reject):
+    """Строки результатов для бланков одной версии опросника."""
+    batch = np.array([s[4] for s in chunk], dtype=np.int32).reshape((len(chunk),) + plan.shape)
+    bad = question_sums(batch) != plan.points_per_question
+    valid = ~bad.any(axis=1)
+    for i in np.flatnonzero(~valid):
+        line_no, record = chunk[i][0], chunk[i][1]
+        sums = question_sums(batch[i])
+        reason = "; ".join(
+            f"вопрос {plan.questions[j]['num']}: сумма {sums[j]}, должна быть {plan.points_per_question}"
+            for j in np.flatnonzero(bad[i])
+        )
+        reject(line_no, reason, record)
+    if not valid.any():
+        return []
+    scores = plan.calculate_batch(batch[valid])
+    rows = []
+    for (_, record, name, timestamp, _, _), factor_row in zip(
+        (s for s, ok in zip(chunk, valid) if ok), scores.tolist()
+    ):
+        row = {"timestamp": timestamp, "name": name}
+        for fid, score in zip(plan.factor_ids, factor_row):
+            row[FACTOR_NAMES[fid]] = score
+        for col in COHORT_COLUMNS:
+            row[col] = str(record.get(col) or "").strip()
+        row[INSTRUMENT_COLUMN] = plan.version
+        rows.append(row)
+    return rows
+
+
+def ingest(path, store, rejects_path=None, chunksize=10_000, instrument=DEFAULT_VERSION):
+    """
+    Загружает бланки из path в store; instrument — версия опросника для
+    записей без поля instrument. Отклонённые строки с причиной
+    пишутся в rejects_path (CSV). Возвращает (принято, отклонено).
+    """
+    accepted = rejected = 0
+    reject_file = open(rejects_path, "w", encoding="utf-8", newline="") if rejects_path else None
+    try:
+        reject_writer = csv.writer(reject_file) if reject_file else None
+        if reject_writer:
+            reject_writer.writerow(REJECT_COLUMNS)
+
+        def reject(line_no, reason, record):
+            nonlocal rejected
+            rejected += 1
+            if reject_writer:
+                raw = record["_raw"] if "_raw" in record else json.dumps(record, ensure_ascii=False)
+                reject_writer.writerow([line_no, reason, raw])
+
+        sheets = parse_stage(read_records(path), reject, instrument)
+        for rows in score_stage(sheets, reject, chunksize):
+            append_results(store, rows)
+            accepted += len(rows)
+    finally:
+        if reject_file:
+            reject_file.close()
+    return accepted, rejected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Загрузка бланков ответов (CSV/JSONL) в хранилище результатов")
+    parser.add_argument("input", help="файл .csv или .jsonl")
+    parser.add_argument("--rejects", default=None, help="CSV для отклонённых строк (по умолчанию <input>.rejects.csv)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=os.environ.get("RESULTS_BACKEND", "csv"))
+    parser.add_argument("--path", default=os.environ.get("RESULTS_PATH"), help="путь к хранилищу")
+    parser.add_argument("--chunksize", type=int, default=10_000, help="строк в одной пакетной записи")
+    parser.add_argument("--instrument", choices=available_versions(), default=DEFAULT_VERSION,
+                        help="версия опросника для строк без поля instrument")
+    args = parser.parse_args(argv)
+
+    rejects_path = args.rejects or args.input + ".rejects.csv"
+    accepted, rejected = ingest(
+        args.input, open_store(args.backend, args.path), rejects_path, args.chunksize,
+        args.instrument,
+    )
+    print(f"Принято: {accepted}, отклонено: {rejected}" + (f" (см. {rejects_path})" if rejected else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# instruments.py
+# Реестр версий опросника. Каждая версия — JSON-файл в каталоге instruments/
+# (вопросы, варианты ответов, ключ подсчёта и названия факторов). Файл
+# проверяется один раз при загрузке и компилируется в неизменяемый план
+# подсчёта (ScoringPlan), который кэшируется в процессе по версии.
+#
+# Все версии считают одни и те же 12 факторов (столбцы хранилища общие),
+# вопросы, формулировки и ключ могут отличаться.
+#
+#   python instruments.py             # проверить все версии
+
+import argparse
+import dataclasses
+import functools
+import json
+import os
+import types
+
+import numpy as np
+
+INSTRUMENTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instruments")
+DEFAULT_VERSION = "richie-martin-v1"
+OPTION_LETTERS = ("a", "b", "c", "d")
+
+
+class InstrumentError(ValueError):
+    """Описание опросника не проходит проверку."""
+
+
+@dataclasses.dataclass(frozen=True, eq=False)
+class ScoringPlan:
+    """
+    Скомпилированная версия опросника. Вопросы и ключ — кортежи и
+    read-only словари, матрица весов (33*4, 12) — массив только для чтения.
+    План один на версию и процесс (load_plan), поэтому сравнивается и
+    хэшируется по идентичности и годится ключом словаря.
+    """
+
+    version: str
+    title: str
+    questions: tuple
+    option_letters: tuple
+    points_per_question: int
+    factor_ids: tuple
+    factor_names: types.MappingProxyType
+    factor_mapping: types.MappingProxyType
+    weights: np.ndarray = dataclasses.field(repr=False)
+    max_factor_scores: types.MappingProxyType = dataclasses.field(repr=False)
+
+    @property
+    def shape(self):
+        """Форма бланка ответов: (число вопросов, число вариантов)."""
+        return len(self.questions), len(self.option_letters)
+
+    def answers_to_array(self, answers):
+        """dict {(q_num, option_letter): баллы} -> массив (вопросы, варианты)."""
+        arr = np.zeros(self.shape, dtype=np.int32)
+        for i, q in enumerate(self.questions):
+            for j, opt in enumerate(self.option_letters):
+                arr[i, j] = answers.get((q["num"], opt), 0)
+        return arr
+
+    def as_array(self, answers):
+        """
+        Бланк ответов как массив (вопросы, варианты): принимает массив той же
+        формы (например, uint8 из сессии), упакованные байты (по байту на
+        пару вопрос–вариант) или dict {(q_num, option_letter): баллы}.
+        """
+        if isinstance(answers, dict):
+            return self.answers_to_array(answers)
+        if isinstance(answers, (bytes, bytearray, memoryview)):
+            arr = np.frombuffer(answers, dtype=np.uint8)
+        else:
+            arr = np.asarray(answers)
+        if arr.size != self.shape[0] * self.shape[1]:
+            raise ValueError(f"ожидается бланк {self.shape[0]}×{self.shape[1]}, получено {arr.shape}")
+        return arr.reshape(self.shape)
+
+    def calculate_batch(self, answers_array):
+        """(N, вопросы, варианты) -> (N, 12): баллы факторов в порядке factor_ids."""
+        arr = np.asarray(answers_array)
+        if arr.ndim != 3 or arr.shape[1:] != self.shape:
+            raise ValueError(
+                f"ожидается массив формы (N, {self.shape[0]}, {self.shape[1]}), "
+                f"получено {arr.shape}"
+            )
+        # float64 умножается через BLAS, целочисленный matmul — простым циклом;
+        # баллы и суммы — небольшие целые, поэтому результат точный
+        flat = arr.reshape(arr.shape[0], -1).astype(np.float64, copy=False)
+        return (flat @ self.weights).astype(np.int32)
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return types.MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _is_int(value):
+    # bool в JSON — true/false, а не номер
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_text(value):
+    return isinstance(value, str) and bool(value.strip())
+
+
+def validate(data):
+    """
+    Проверяет описание опросника; бросает InstrumentError со списком всех
+    найденных ошибок (в том числе для полей и записей не того типа).
+    """
+    if not isinstance(data, dict):
+        raise InstrumentError("описание опросника должно быть JSON-объектом")
+    errors = []
+    required = (("version", str), ("questions", list), ("factors", list), ("points_per_question", int))
+    for key, kind in required:
+        if key not in data:
+            errors.append(f"нет поля {key!r}")
+        elif not isinstance(data[key], kind) or isinstance(data[key], bool):
+            errors.append(f"поле {key!r} должно быть типа {kind.__name__}")
+    if errors:
+        raise InstrumentError("; ".join(errors))
+
+    if data["points_per_question"] <= 0:
+        errors.append("points_per_question должно быть больше нуля")
+    if "title" in data and not _is_text(data["title"]):
+        errors.append("поле 'title' должно быть непустой строкой")
+    letters = data.get("option_letters", list(OPTION_LETTERS))
+    if not isinstance(letters, list) or tuple(letters) != OPTION_LETTERS:
+        errors.append(f"варианты ответа должны быть {', '.join(OPTION_LETTERS)}, указаны {letters!r}")
+
+    questions = []
+    for i, q in enumerate(data["questions"], 1):
+        if isinstance(q, dict):
+            questions.append(q)
+        else:
+            errors.append(f"вопрос №{i} в списке: ожидается объект, указано {q!r}")
+    if not data["questions"]:
+        errors.append("нет вопросов")
+    nums = [q.get("num") for q in questions]
+    if len(set(map(repr, nums))) != len(nums):
+        errors.append("номера вопросов повторяются")
+    if not all(_is_int(n) for n in nums):
+        errors.append("номер вопроса должен быть целым числом")
+    existing = set()
+    for q in questions:
+        if not _is_text(q.get("text")):
+            errors.append(f"вопрос {q.get('num')!r}: нет текста")
+        options = q.get("options", {})
+        if not isinstance(options, dict):
+            errors.append(f"вопрос {q.get('num')!r}: варианты должны быть объектом {{буква: текст}}")
+            continue
+        if set(options) != set(OPTION_LETTERS):
+            errors.append(f"вопрос {q.get('num')!r}: варианты {sorted(options)} вместо a–d")
+        if not all(_is_text(text) for text in options.values()):
+            errors.append(f"вопрос {q.get('num')!r}: у каждого варианта должен быть текст")
+        if _is_int(q.get("num")):
+            existing.update((q["num"], opt) for opt in options)
+
+    factors = []
+    for i, factor in enumerate(data["factors"], 1):
+        if isinstance(factor, dict):
+            factors.append(factor)
+        else:
+            errors.append(f"фактор №{i} в списке: ожидается объект, указано {factor!r}")
+    ids = [f.get("id") for f in factors]
+    if len(set(map(repr, ids))) != len(ids):
+        errors.append("идентификаторы факторов повторяются")
+    if not all(_is_int(fid) for fid in ids):
+        errors.append("идентификатор фактора должен быть целым числом")
+    for factor in factors:
+        fid = factor.get("id")
+        if not _is_text(factor.get("name")):
+            errors.append(f"фактор {fid!r}: нет названия")
+        items = factor.get("items")
+        if not items:
+            errors.append(f"фактор {fid!r}: пустой ключ")
+            continue
+        if not isinstance(items, list):
+            errors.append(f"фактор {fid!r}: ключ должен быть списком пар [вопрос, вариант]")
+            continue
+        for item in items:
+            if not isinstance(item, list) or len(item) != 2:
+                errors.append(f"фактор {fid!r}: {item!r} — не пара [вопрос, вариант]")
+            elif not (_is_int(item[0]) and isinstance(item[1], str)) or tuple(item) not in existing:
+                errors.append(f"фактор {fid!r}: пары (вопрос, вариант) {item!r} нет в опроснике")
+    if errors:
+        raise InstrumentError(f"{data['version']}: " + "; ".join(errors))
+
+
+def compile_plan(data):
+    """Проверенное описание -> ScoringPlan."""
+    validate(data)
+    questions = data["questions"]
+    factors = sorted(data["factors"], key=lambda f: f["id"])
+    factor_ids = tuple(f["id"] for f in factors)
+    q_index = {q["num"]: i for i, q in enumerate(questions)}
+    weights = np.zeros((len(questions) * len(OPTION_LETTERS), len(factor_ids)), dtype=np.float64)
+    for col, factor in enumerate(factors):
+        for q_num, opt in factor["items"]:
+            weights[q_index[q_num] * len(OPTION_LETTERS) + OPTION_LETTERS.index(opt), col] += 1
+    weights.setflags(write=False)
+    points = int(data["points_per_question"])
+    return ScoringPlan(
+        version=data["version"],
+        title=data.get("title", data["version"]),
+        questions=_freeze(questions),
+        option_letters=OPTION_LETTERS,
+        points_per_question=points,
+        factor_ids=factor_ids,
+        factor_names=types.MappingProxyType({f["id"]: f["name"] for f in factors}),
+        factor_mapping=types.MappingProxyType(
+            {f["id"]: tuple((q, o) for q, o in f["items"]) for f in factors}
+        ),
+        weights=weights,
+        # не больше points баллов с каждого вопроса, варианты которого входят в ключ
+        max_factor_scores=types.MappingProxyType(
+            {f["id"]: points * len({q for q, _ in f["items"]}) for f in factors}
+        ),
+    )
+
+
+def available_versions():
+    """Версии опросника, для которых есть файлы в INSTRUMENTS_DIR."""
+    return sorted(
+        name[:-len(".json")] for name in os.listdir(INSTRUMENTS_DIR) if name.endswith(".json")
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def plan_error(version):
+    """Текст InstrumentError версии или None, если она проходит проверку."""
+    try:
+        load_plan(version)
+    except InstrumentError as e:
+        return str(e)
+    return None
+
+
+def valid_versions():
+    """Версии из available_versions(), описания которых проходят проверку."""
+    return [version for version in available_versions() if plan_error(version) is None]
+
+
+@functools.lru_cache(maxsize=None)
+def load_plan(version=DEFAULT_VERSION):
+    """План подсчёта версии (загружается и проверяется один раз на процесс)."""
+    path = os.path.join(INSTRUMENTS_DIR, f"{version}.json")
+    if os.path.basename(path) != f"{version}.json" or not os.path.exists(path):
+        raise InstrumentError(f"неизвестная версия опросника: {version!r}")
+    with open(path, encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise InstrumentError(f"{path}: не JSON ({e})") from None
+    if not isinstance(data, dict):
+        raise InstrumentError(f"{path}: описание опросника должно быть JSON-объектом")
+    if data.get("version") != version:
+        raise InstrumentError(f"{path}: version={data.get('version')!r} не совпадает с именем файла")
+    plan = compile_plan(data)
+    if version != DEFAULT_VERSION:
+        base = load_plan(DEFAULT_VERSION)
+        if dict(plan.factor_names) != dict(base.factor_names):
+            raise InstrumentError(f"{version}: факторы должны совпадать с {DEFAULT_VERSION}")
+    return plan
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Проверка версий опросника")
+    parser.add_argument("versions", nargs="*", help="по умолчанию — все из instruments/")
+    args = parser.parse_args(argv)
+    failed = False
+    for version in args.versions or available_versions():
+        try:
+            plan = load_plan(version)
+        except InstrumentError as e:
+            print(f"ОШИБКА {e}")
+            failed = True
+        else:
+            print(f"OK {plan.version}: {len(plan.questions)} вопросов, {len(plan.factor_ids)} факторов")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
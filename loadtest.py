@@ -0,0 +1,251 @@
+# loadtest.py
+# Нагрузочный прогон приложения через встроенный тестовый API Streamlit (AppTest):
+# много «сессий» заполняют форму, отправляют её и открывают групповой дашборд.
+# Печатает перцентили задержки перезапусков скрипта, память процесса и
+# проверяет, что под конкуренцией не потерялись строки.
+#
+# AppTest на время каждого перезапуска подменяет глобальный Runtime, поэтому
+# внутри одного процесса перезапуски не могут идти параллельно. Конкуренция
+# создаётся пулом процессов-воркеров, которые пишут в одно хранилище;
+# каждый воркер держит свои сессии открытыми одновременно и проводит их по
+# шагам поочерёдно — как сервер, обслуживающий много вкладок. Пока сессии
+# отправляют формы, отдельный поток воркера читает агрегаты дашборда
+# параллельно с фоновым писателем (writer.py) и проверяет их согласованность.
+#
+#   python loadtest.py --sessions 200 --concurrency 8 --backend sqlite
+
+import argparse
+import concurrent.futures as cf
+import os
+import resource
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from benchmarks import random_answer_sheets
+from scoring import OPTION_LETTERS, QUESTIONS
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+NAME_PREFIX = "loadtest-"
+# подтверждённая запись или строка, принятая в очередь фоновой записи
+SUCCESS_TEXTS = ("Ответы сохранены", "Ответы приняты")
+DASHBOARD_TAB = "📈 Групповой дашборд"
+WATCH_INTERVAL = 0.01  # пауза между чтениями агрегатов в потоке проверки, секунды
+
+
+def _rss_mb():
+    """Текущий RSS процесса (Linux: /proc/self/statm), иначе пиковый."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return _peak_rss_mb()
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    return peak / 2**20 if os.uname().sysname == "Darwin" else peak / 1024
+
+
+def _timed(timings, stage, fn):
+    start = time.perf_counter()
+    result = fn()
+    timings.setdefault(stage, []).append(time.perf_counter() - start)
+    return result
+
+
+def _open_session(timeout):
+    from streamlit.testing.v1 import AppTest
+
+    return AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+
+def _fill_and_submit(at, idx, sheet, timings):
+    at.text_input[0].set_value(f"{NAME_PREFIX}{idx}")
+    for i, q in enumerate(QUESTIONS):
+        for j, opt in enumerate(OPTION_LETTERS):
+            at.number_input(key=f"q{q['num']}_{opt}").set_value(int(sheet[i, j]))
+    submit = next(b for b in at.button if b.label.startswith("Отправить"))
+    _timed(timings, "submit", submit.click().run)
+    messages = [m.value for m in list(at.success) + list(at.info)]
+    return not at.exception and any(t in m for t in SUCCESS_TEXTS for m in messages)
+
+
+def _open_dashboard_rows(at, timings):
+    # выбор вкладки AppTest не запоминает: задаём его перед каждым перезапуском
+    at.session_state["main_tab"] = DASHBOARD_TAB
+    _timed(timings, "dashboard", at.run)
+    rows_toggle = next(t for t in at.toggle if t.label == "Показать строки результатов")
+    at.session_state["main_tab"] = DASHBOARD_TAB
+    _timed(timings, "dashboard_rows", rows_toggle.set_value(True).run)
+    return not at.exception
+
+
+def _watch_dashboard(stop, reads, problems):
+    """
+    Читает агрегаты так же, как вкладка дашборда (значения подгрупп, разбивка,
+    динамика), пока идут отправки и фоновый писатель дописывает пачки.
+    Исключения и состояния, где общий счётчик, гистограмма и куб расходятся,
+    записываются в problems.
+    """
+    from aggregates import get_aggregates
+    from storage import COHORT_COLUMNS, get_store
+
+    store = get_store()
+    while not stop.wait(WATCH_INTERVAL):
+        try:
+            state = get_aggregates(store)
+            for col in COHORT_COLUMNS:
+                state.cube.values(col)
+                state.cube.breakdown(col)
+            state.trend.series("week", window=4)
+            counts = (state.total.count, state.hist.count, state.cube.get().count)
+            if len(set(counts)) > 1:
+                problems.append(f"агрегаты расходятся: {counts}")
+        except Exception as e:
+            problems.append(f"{type(e).__name__}: {e}")
+        reads[0] += 1
+
+
+def run_worker(indices, sheets, timeout):
+    """
+    Процесс-воркер: открывает все свои сессии, затем по очереди проводит
+    каждую через шаги «первая отрисовка -> отправка формы -> дашборд».
+    Возвращает (задержки по шагам, номера сессий с подтверждённой отправкой,
+    RSS и пиковый RSS в МБ, число параллельных чтений агрегатов, их ошибки).
+    """
+    timings = {}
+    stop, reads, problems = threading.Event(), [0], []
+    watcher = threading.Thread(target=_watch_dashboard, args=(stop, reads, problems), daemon=True)
+    watcher.start()
+    sessions = {}
+    ok = {}
+    steps = (
+        lambda idx, at: not _timed(timings, "first_render", at.run).exception,
+        lambda idx, at: _fill_and_submit(at, idx, sheets[idx], timings),
+        lambda idx, at: _open_dashboard_rows(at, timings),
+    )
+    for idx in indices:
+        sessions[idx] = _open_session(timeout)
+        ok[idx] = True
+    for step_no, step in enumerate(steps):
+        for idx, at in sessions.items():
+            if not ok[idx]:
+                continue
+            try:
+                result = step(idx, at)
+            except Exception as e:  # сессия упала — считаем неуспешной, прогон продолжаем
+                print(f"сессия {idx}: {type(e).__name__}: {e}")
+                result = False
+            if step_no < 2:
+                ok[idx] = bool(result)
+    # строки из очереди фонового писателя должны попасть в хранилище до подсчёта
+    from writer import flush_all
+
+    flush_all()
+    stop.set()
+    watcher.join()
+    acked = [idx for idx, success in ok.items() if success]
+    return timings, acked, _rss_mb(), _peak_rss_mb(), reads[0], problems
+
+
+def run(sessions, concurrency, timeout=120, seed=13):
+    """Запускает прогон; хранилище берётся из RESULTS_BACKEND / RESULTS_PATH."""
+    from aggregates import get_aggregates
+    from storage import get_store
+
+    store = get_store()
+    before = store.count()
+    sheets = random_answer_sheets(sessions, np.random.default_rng(seed))
+    timings = {}
+    acked = []
+    rss, peaks = [], []
+    reads, problems = 0, []
+
+    start = time.perf_counter()
+    with cf.ProcessPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(run_worker, list(range(w, sessions, concurrency)), sheets, timeout)
+            for w in range(min(concurrency, sessions))
+        ]
+        for fut in cf.as_completed(futures):
+            (worker_timings, worker_acked, worker_rss, worker_peak,
+             worker_reads, worker_problems) = fut.result()
+            for stage, values in worker_timings.items():
+                timings.setdefault(stage, []).extend(values)
+            acked.extend(worker_acked)
+            rss.append(worker_rss)
+            peaks.append(worker_peak)
+            reads += worker_reads
+            problems.extend(worker_problems)
+    elapsed = time.perf_counter() - start
+
+    submitted = len(acked)
+    after = store.count()
+    names = set(store.load(name_prefix=NAME_PREFIX)["name"].astype(str))
+    # только сессии, которым запись была подтверждена: неуспешная отправка
+    # (ошибка или сбой сессии) строку и не должна была оставить
+    missing = len({f"{NAME_PREFIX}{i}" for i in acked} - names)
+    return {
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "failed_sessions": sessions - submitted,
+        "rows_expected": before + submitted,
+        "rows_found": after,
+        "lost_rows": before + submitted - after,
+        "sessions_without_row": missing,
+        "aggregates_match": get_aggregates(store).total.count == after,
+        "concurrent_reads": reads,
+        "concurrent_read_errors": problems,
+        "worker_rss_mb": max(rss, default=0.0),
+        "worker_peak_rss_mb": max(peaks, default=0.0),
+        "sessions_per_worker": -(-sessions // max(1, concurrency)),
+        "latency_ms": {
+            stage: {
+                f"p{q}": float(np.percentile(values, q)) * 1000 for q in (50, 90, 95, 99)
+            }
+            for stage, values in timings.items()
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон приложения через AppTest")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default="csv")
+    parser.add_argument("--path", default=None, help="хранилище (по умолчанию — временное)")
+    parser.add_argument("--timeout", type=float, default=120, help="таймаут одного перезапуска, с")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.environ["RESULTS_BACKEND"] = args.backend
+        os.environ["RESULTS_PATH"] = args.path or os.path.join(
+            tmpdir, "results.db" if args.backend == "sqlite" else "results.csv"
+        )
+        stats = run(args.sessions, args.concurrency, args.timeout)
+
+    print(f"Сессий: {stats['sessions']} (параллельно {stats['concurrency']}) за {stats['seconds']:.1f} с, "
+          f"неуспешных: {stats['failed_sessions']}")
+    for stage, pct in stats["latency_ms"].items():
+        print(f"  {stage:<16} " + "  ".join(f"{k}={v:8.1f} мс" for k, v in pct.items()))
+    print(f"Память воркера ({stats['sessions_per_worker']} открытых сессий): "
+          f"RSS {stats['worker_rss_mb']:.0f} МБ, пик {stats['worker_peak_rss_mb']:.0f} МБ")
+    print(f"Строк: ожидалось {stats['rows_expected']}, найдено {stats['rows_found']}, "
+          f"потеряно {stats['lost_rows']}, сессий без строки {stats['sessions_without_row']}, "
+          f"агрегаты {'сходятся' if stats['aggregates_match'] else 'НЕ сходятся'}")
+    errors = stats["concurrent_read_errors"]
+    print(f"Чтений агрегатов во время записи: {stats['concurrent_reads']}, ошибок: {len(errors)}")
+    for problem in sorted(set(errors))[:5]:
+        print(f"  {problem}")
+    if stats["lost_rows"] or stats["sessions_without_row"] or not stats["aggregates_match"] or errors:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+# report.py
+# Индивидуальный PDF-отчёт по мотивационному профилю и командный отчёт
+# по подгруппе (факультет/уровень), который строится из инкрементальных
+# агрегатов (aggregates.py) без чтения строк результатов.
+# fpdf и метрики шрифта загружаются при первом построении отчёта, а не при
+# импорте: большинству сессий PDF не нужен.
+
+import collections
+import datetime
+import functools
+import os
+import re
+import tempfile
+import threading
+
+from aggregates import get_aggregates
+from charts import FONT_PATH, bar_png, levels_png
+from scoring import FACTOR_IDS, FACTOR_NAMES
+from storage import COHORT_COLUMNS, COHORT_LABELS
+
+# Версия шаблона отчёта: увеличивать при любом изменении вёрстки,
+# чтобы не отдавать из кэша PDF старого вида
+TEMPLATE_VERSION = 4
+PDF_CACHE_SIZE = 256
+TEAM_CACHE_SIZE = 64
+LEVELS = ("низкий", "средний", "высокий")
+TOP_FACTORS = 3
+
+# Русские описания факторов для PDF
+FACTOR_DESCRIPTIONS_RU = {
+    1: "Для вас важна ощутимая связь между усилиями и вознаграждением. Высокий доход, премии и бонусы — значимый источник мотивации.",
+    2: "Вы цените стабильность, предсказуемость и безопасные условия труда. Сильный стресс и нестабильность снижают вашу мотивацию.",
+    3: "Вам комфортно, когда есть понятные правила, регламенты и структура. Неопределённость и хаос воспринимаются как демотиваторы.",
+    4: "Для вас важны хорошие отношения в команде, доверие и поддержка коллег. Конфликты и токсичная среда сильно снижают мотивацию.",
+    5: "Вам важно признание результатов, уважение и статус. Вы хотите, чтобы вклад был заметен и оценён.",
+    6: "Вас мотивирует возможность применять и развивать свои способности на содержательных задачах, а не «просто быть занятым».",
+    7: "Вы предпочитаете интересную, осмысленную работу, в которой есть интеллектуальный вызов, а не рутину ради процесса.",
+    8: "Вас заряжают разнообразие задач, новые проекты и перемены. Монотонная, однообразная работа быстро снижает мотивацию.",
+    9: "Для вас важна свобода в способах достижения результата. Избыточный контроль и микроменеджмент воспринимаются как давление.",
+    10: "Вас мотивируют амбициозные цели, измеримый результат и ощущение прогресса. Вам важно видеть, чего вы достигли.",
+    11: "Вам нравится придумывать новые решения, улучшать процессы и подходить к задачам творчески, а не работать «по инструкции».",
+    12: "Для вас важно чувствовать, что работа приносит реальную пользу людям и обществу, а не сводится только к формальному результату.",
+}
+
+
+def classify_level(score: int) -> str:
+    """0–34 низкий, 35–69 средний, 70+ высокий уровень фактора."""
+    if score >= 70:
+        return "высокий"
+    elif score >= 35:
+        return "средний"
+    return "низкий"
+
+
+@functools.lru_cache(maxsize=None)
+def _font_metrics():
+    """
+    Разбирает метрики Roboto один раз на процесс (вместо add_font,
+    который читает и распаковывает их заново для каждого документа).
+    """
+    from fpdf.ttfonts import TTFontFile
+
+    ttf = TTFontFile()
+    ttf.getMetrics(FONT_PATH)
+    return {
+        "name": re.sub("[ ()]", "", ttf.fullName),
+        "desc": {
+            "Ascent": int(round(ttf.ascent, 0)),
+            "Descent": int(round(ttf.descent, 0)),
+            "CapHeight": int(round(ttf.capHeight, 0)),
+            "Flags": ttf.flags,
+            "FontBBox": "[%s %s %s %s]" % tuple(int(round(b, 0)) for b in ttf.bbox),
+            "ItalicAngle": int(ttf.italicAngle),
+            "StemV": int(round(ttf.stemV, 0)),
+            "MissingWidth": int(round(ttf.defaultWidth, 0)),
+        },
+        "up": round(ttf.underlinePosition),
+        "ut": round(ttf.underlineThickness),
+        "cw": ttf.charWidths,
+        "originalsize": os.stat(FONT_PATH).st_size,
+    }
+
+
+def _add_roboto(pdf, style=""):
+    """
+    Регистрирует Roboto в документе по общим метрикам — аналог
+    pdf.add_font("Roboto", style, FONT_PATH, uni=True) для fpdf 1.7.2.
+    Таблица ширин общая и только читается; список subset свой у документа.
+    """
+    metrics = _font_metrics()
+    fontkey = "roboto" + style
+    pdf.fonts[fontkey] = {
+        "i": len(pdf.fonts) + 1, "type": "TTF",
+        "name": metrics["name"], "desc": metrics["desc"],
+        "up": metrics["up"], "ut": metrics["ut"],
+        "cw": metrics["cw"],
+        "ttffile": FONT_PATH, "fontkey": fontkey,
+        "subset": list(range(0, 32)), "unifilename": None,
+    }
+    pdf.font_files[fontkey] = {
+        "length1": metrics["originalsize"], "type": "TTF", "ttffile": FONT_PATH,
+    }
+    pdf.font_files[FONT_PATH] = {"type": "TTF"}
+
+
+def _add_png(pdf, png_bytes, w):
+    """fpdf 1.7.2 читает картинки только из файла: PNG разбирается сразу при вызове."""
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
+        tmp.write(png_bytes)
+    try:
+        pdf.image(tmp.name, w=w)
+    finally:
+        os.remove(tmp.name)
+
+
+def build_pdf_report(name: str, factor_scores: dict, percentiles: dict = None) -> bytes:
+    """
+    Формирует PDF с мотивационным профилем участника на русском языке
+    с использованием шрифта Roboto (поддержка кириллицы).
+    percentiles — необязательный dict {factor_id: перцентиль в группе}.
+    Готовые PDF кэшируются по (имя, баллы факторов, перцентили, версия шаблона).
+    """
+    scores = tuple(sorted(factor_scores.items()))
+    ranks = tuple(sorted((fid, round(p)) for fid, p in (percentiles or {}).items()))
+    return _render_pdf(name, scores, TEMPLATE_VERSION, ranks)
+
+
+@functools.lru_cache(maxsize=PDF_CACHE_SIZE)
+def _render_pdf(name: str, scores: tuple, template_version: int, ranks: tuple = ()) -> bytes:
+    from fpdf import FPDF
+
+    factor_scores = dict(scores)
+    percentiles = dict(ranks)
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+
+    # Подключаем шрифт Roboto как основной
+    _add_roboto(pdf, "")
+    _add_roboto(pdf, "B")
+
+    pdf.add_page()
+
+    # Заголовок
+    pdf.set_font("Roboto", "B", 16)
+    pdf.set_text_color(40, 40, 40)
+    pdf.cell(0, 10, "Мотивационный профиль (12 факторов)", ln=True)
+
+    pdf.set_font("Roboto", "", 12)
+    pdf.set_text_color(60, 60, 60)
+    pdf.cell(0, 7, f"Участник: {name}", ln=True)
+    pdf.ln(3)
+
+    pdf.set_font("Roboto", "", 10)
+    pdf.multi_cell(
+        0,
+        5,
+        "Чем выше значение фактора, тем больше он влияет на вашу мотивацию. "
+        "Уровни интерпретации: 0–34 — низкий, 35–69 — средний, 70 и более — высокий."
+        + (" Перцентиль — доля группы (в %) со значением фактора ниже вашего; "
+           "совпадающие значения учитываются наполовину."
+           if percentiles else ""),
+    )
+    pdf.ln(4)
+
+    # Таблица факторов
+    pdf.set_font("Roboto", "B", 11)
+    pdf.set_fill_color(230, 230, 230)
+    pdf.set_text_color(20, 20, 20)
+
+    name_w = 90 if percentiles else 100
+    pdf.cell(name_w, 8, "Фактор", border=1, fill=True)
+    pdf.cell(25, 8, "Баллы", border=1, fill=True, align="C")
+    pdf.cell(35, 8, "Уровень", border=1, fill=True, align="C")
+    if percentiles:
+        pdf.cell(30, 8, "Перцентиль", border=1, fill=True, align="C")
+    pdf.ln(8)
+
+    pdf.set_font("Roboto", "", 10)
+    pdf.set_text_color(40, 40, 40)
+
+    # факторы по убыванию значимости
+    for fid in sorted(factor_scores.keys(), key=lambda x: -factor_scores[x]):
+        score = factor_scores[fid]
+        level = classify_level(score)
+        fname = FACTOR_NAMES.get(fid, f"Фактор {fid}")
+
+        pdf.cell(name_w, 7, fname, border=1)
+        pdf.cell(25, 7, str(score), border=1, align="C")
+        pdf.cell(35, 7, level, border=1, align="C")
+        if percentiles:
+            pdf.cell(30, 7, str(percentiles.get(fid, "—")), border=1, align="C")
+        pdf.ln(7)
+
+    pdf.ln(4)
+
+    # Диаграмма: тот же статический PNG, что и в облегчённом режиме приложения
+    _add_png(pdf, bar_png(scores, "12 факторов мотивации"), w=pdf.w - pdf.l_margin - pdf.r_margin)
+    pdf.ln(4)
+
+    # Интерпретации
+    pdf.set_font("Roboto", "B", 12)
+    pdf.set_text_color(30, 30, 30)
+    pdf.cell(0, 8, "Интерпретация профиля:", ln=True)
+    pdf.ln(2)
+
+    for fid in sorted(factor_scores.keys(), key=lambda x: -factor_scores[x]):
+        score = factor_scores[fid]
+        level = classify_level(score)
+        fname = FACTOR_NAMES.get(fid, f"Фактор {fid}")
+        desc = FACTOR_DESCRIPTIONS_RU.get(fid, "")
+
+        pdf.set_font("Roboto", "B", 11)
+        pdf.set_text_color(40, 40, 80)
+        line = f"{fname} — {score} баллов ({level} уровень)"
+        if fid in percentiles:
+            line += f", перцентиль в группе — {percentiles[fid]}"
+        pdf.multi_cell(0, 6, line)
+
+        if desc:
+            pdf.set_font("Roboto", "", 10)
+            pdf.set_text_color(40, 40, 40)
+            pdf.multi_cell(0, 5, desc)
+        pdf.ln(2)
+
+    pdf_bytes = pdf.output(dest="S").encode("latin1")
+    return pdf_bytes
+
+
+def level_counts(hist):
+    """
+    Число участников с низким/средним/высоким уровнем каждого фактора по
+    гистограмме подгруппы: {factor_id: (низкий, средний, высокий)}.
+    """
+    levels = [LEVELS.index(classify_level(score)) for score in range(hist.counts.shape[1])]
+    out = {}
+    for i, fid in enumerate(FACTOR_IDS):
+        counts = [0] * len(LEVELS)
+        for level, n in zip(levels, hist.counts[i].tolist()):
+            counts[level] += n
+        out[fid] = tuple(counts)
+    return out
+
+
+def team_title(**filters):
+    """Подпись подгруппы: «Факультет: ФЭН, Уровень: N-1» или «Вся группа»."""
+    parts = [f"{COHORT_LABELS[col]}: {filters[col]}" for col in COHORT_COLUMNS if filters.get(col)]
+    return ", ".join(parts) or "Вся группа"
+
+
+_team_cache = collections.OrderedDict()
+_team_lock = threading.Lock()
+
+
+def build_team_report(store, title=None, **filters) -> bytes:
+    """
+    Командный PDF по подгруппе (filters: faculty, level) из ячейки куба
+    агрегатов: средние, распределения и уровни по факторам, ведущие и
+    наименее выраженные факторы. Готовые PDF кэшируются по (хранилище,
+    версия данных, подгруппа, версия шаблона): повторная выгрузка без новых
+    результатов не перестраивает отчёт.
+    """
+    state = get_aggregates(store)
+    cell = tuple(filters.get(col) or None for col in COHORT_COLUMNS)
+    title = title or team_title(**filters)
+    key = (store.path, state.version, cell, title, TEMPLATE_VERSION)
+    with _team_lock:
+        if key in _team_cache:
+            _team_cache.move_to_end(key)
+            return _team_cache[key]
+    cohort = dict(zip(COHORT_COLUMNS, cell))
+    pdf_bytes = _render_team_pdf(
+        title, state.cube.get(**cohort), state.cube.histogram(**cohort), state.total
+    )
+    with _team_lock:
+        _team_cache[key] = pdf_bytes
+        while len(_team_cache) > TEAM_CACHE_SIZE:
+            _team_cache.popitem(last=False)
+    return pdf_bytes
+
+
+def _render_team_pdf(title, stats, hist, total):
+    from fpdf import FPDF
+
+    means, stds = stats.means(), stats.stds()
+    group_means = total.means()
+    counts = level_counts(hist)
+    order = sorted(FACTOR_IDS, key=lambda fid: -means.get(fid, 0))
+
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    _add_roboto(pdf, "")
+    _add_roboto(pdf, "B")
+    pdf.add_page()
+
+    # Заголовок
+    pdf.set_font("Roboto", "B", 16)
+    pdf.set_text_color(40, 40, 40)
+    pdf.cell(0, 10, "Мотивационный профиль команды (12 факторов)", ln=True)
+
+    pdf.set_font("Roboto", "", 12)
+    pdf.set_text_color(60, 60, 60)
+    pdf.cell(0, 7, f"Подгруппа: {title}", ln=True)
+    pdf.cell(0, 7, f"Участников: {stats.count}   Дата: {datetime.date.today():%d.%m.%Y}", ln=True)
+    pdf.ln(3)
+
+    pdf.set_font("Roboto", "", 10)
+    pdf.multi_cell(
+        0,
+        5,
+        "Среднее — средний балл фактора по участникам подгруппы. "
+        "Уровни интерпретации: 0–34 — низкий, 35–69 — средний, 70 и более — высокий; "
+        "в столбцах уровней — доля участников подгруппы (в %) с таким уровнем фактора.",
+    )
+    pdf.ln(4)
+
+    if not stats.count:
+        pdf.cell(0, 7, "В подгруппе пока нет результатов.", ln=True)
+        return pdf.output(dest="S").encode("latin1")
+
+    # Таблица факторов
+    pdf.set_font("Roboto", "B", 11)
+    pdf.set_fill_color(230, 230, 230)
+    pdf.set_text_color(20, 20, 20)
+    pdf.cell(90, 8, "Фактор", border=1, fill=True)
+    pdf.cell(20, 8, "Среднее", border=1, fill=True, align="C")
+    pdf.cell(20, 8, "Ст. откл.", border=1, fill=True, align="C")
+    for level in LEVELS:
+        pdf.cell(20, 8, level.capitalize(), border=1, fill=True, align="C")
+    pdf.ln(8)
+
+    pdf.set_font("Roboto", "", 10)
+    pdf.set_text_color(40, 40, 40)
+    for fid in order:
+        pdf.cell(90, 7, FACTOR_NAMES.get(fid, f"Фактор {fid}"), border=1)
+        pdf.cell(20, 7, f"{means[fid]:.1f}", border=1, align="C")
+        pdf.cell(20, 7, f"{stds[fid]:.1f}", border=1, align="C")
+        for n in counts[fid]:
+            pdf.cell(20, 7, f"{100 * n / stats.count:.0f}%", border=1, align="C")
+        pdf.ln(7)
+    pdf.ln(4)
+
+    # Диаграммы: средние и распределение уровней
+    width = pdf.w - pdf.l_margin - pdf.r_margin
+    mean_key = tuple((fid, round(means[fid], 1)) for fid in FACTOR_IDS)
+    _add_png(pdf, bar_png(mean_key, "Средние значения факторов"), w=width)
+    pdf.ln(4)
+    shares = tuple(
+        (fid, tuple(round(n / stats.count, 4) for n in counts[fid])) for fid in order
+    )
+    _add_png(pdf, levels_png(shares, "Распределение уровней факторов", LEVELS), w=width)
+    pdf.ln(4)
+
+    # Ведущие и наименее выраженные факторы
+    for heading, fids in (
+        ("Ведущие факторы команды:", order[:TOP_FACTORS]),
+        ("Наименее выраженные факторы:", order[-TOP_FACTORS:][::-1]),
+    ):
+        pdf.set_font("Roboto", "B", 12)
+        pdf.set_text_color(30, 30, 30)
+        pdf.cell(0, 8, heading, ln=True)
+        pdf.ln(2)
+        for fid in fids:
+            pdf.set_font("Roboto", "B", 11)
+            pdf.set_text_color(40, 40, 80)
+            line = f"{FACTOR_NAMES.get(fid, f'Фактор {fid}')} — в среднем {means[fid]:.1f} баллов"
+            line += f" ({classify_level(round(means[fid]))} уровень)"
+            if group_means and total.count != stats.count:
+                line += f", по всей группе {group_means[fid]:.1f}"
+            pdf.multi_cell(0, 6, line)
+            desc = FACTOR_DESCRIPTIONS_RU.get(fid, "")
+            if desc:
+                pdf.set_font("Roboto", "", 10)
+                pdf.set_text_color(40, 40, 40)
+                pdf.multi_cell(0, 5, desc)
+            pdf.ln(2)
+
+    return pdf.output(dest="S").encode("latin1")
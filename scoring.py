@@ -1,398 +1,73 @@
 # scoring.py
-# Вопросы и ключ подсчёта 12 факторов мотивационного профиля (Ричи–Мартин)
-# Вопросы взяты из файла "Мотивационный_опросник_с_12_типами_мотивации.docx"
+# Вопросы и ключ подсчёта 12 факторов мотивационного профиля (Ричи–Мартин).
+# Сам опросник описан в instruments/<версия>.json (см. instruments.py);
+# константы модуля — версия по умолчанию, функции принимают план другой версии.
 
-QUESTIONS = [
-    {
-        "num": 1,
-        "text": "Я хотел бы иметь такую работу, на которой:",
-        "options": {
-            "a": "была бы хорошая заработная плата и дополнительные льготы",
-            "b": "я мог бы планировать работу по своему усмотрению",
-            "c": "мою деятельность смогли бы заметить и оценить другие люди",
-            "d": "было бы много разнообразия и перемен",
-        },
-    },
-    {
-        "num": 2,
-        "text": "Я считаю, что в работе самым важным является:",
-        "options": {
-            "a": "хорошая заработная плата и прочие виды вознаграждений",
-            "b": "возможность установить хорошие взаимоотношения с коллегами по работе",
-            "c": "я мог бы влиять на принятие решений и демонстрировать свои достоинства как работника",
-            "d": "возможность совершенствоваться и расти как личность",
-        },
-    },
-    {
-        "num": 3,
-        "text": "Деньги для меня:",
-        "options": {
-            "a": "представляют собой справедливое вознаграждение за затраченные усилия",
-            "b": "гарантируют безопасность и обеспеченность в будущем",
-            "c": "средство для достижения определённых целей и реализации планов",
-            "d": "побочный продукт успешного выполнения работы",
-        },
-    },
-    {
-        "num": 4,
-        "text": "Мне нравится работа, которая:",
-        "options": {
-            "a": "хорошо оплачивается",
-            "b": "обеспечивает ощущение безопасности",
-            "c": "позволяет мне совершенствовать свои профессиональные качества",
-            "d": "сопряжена с определённым объёмом рутинных операций",
-        },
-    },
-    {
-        "num": 5,
-        "text": "В работе для меня важно:",
-        "options": {
-            "a": "чётко знать, что и как следует делать",
-            "b": "иметь надёжные условия труда и социальные гарантии",
-            "c": "получать существенные материальные вознаграждения",
-            "d": "иметь возможность хорошо зарабатывать при успешной работе",
-        },
-    },
-    {
-        "num": 6,
-        "text": "Я предпочитаю работу, которая:",
-        "options": {
-            "a": "обеспечивает мне стабильность",
-            "b": "даёт возможности для творческого подхода",
-            "c": "представляет собой интересную и содержательную деятельность",
-            "d": "имеет общественную значимость",
-        },
-    },
-    {
-        "num": 7,
-        "text": "Для меня важно:",
-        "options": {
-            "a": "получать признание за успешно выполненную работу",
-            "b": "работать в комфортных условиях",
-            "c": "иметь возможность развивать свои способности",
-            "d": "ставить перед собой сложные цели и достигать их",
-        },
-    },
-    {
-        "num": 8,
-        "text": "Я предпочитаю, чтобы моя работа:",
-        "options": {
-            "a": "включала элементы новизны и разнообразия",
-            "b": "предоставляла мне возможность достигать значимых результатов",
-            "c": "была интересной и содержательной",
-            "d": "предоставляла возможности для творчества",
-        },
-    },
-    {
-        "num": 9,
-        "text": "Важнее всего для меня в работе:",
-        "options": {
-            "a": "чувствовать уважение и признание со стороны других",
-            "b": "иметь возможность применять свои способности",
-            "c": "выполнять общественно полезную деятельность",
-            "d": "получать достойное материальное вознаграждение",
-        },
-    },
-    {
-        "num": 10,
-        "text": "На работе я больше всего ценю:",
-        "options": {
-            "a": "четко организованную работу и отсутствие хаоса",
-            "b": "хорошие отношения с коллегами",
-            "c": "определённую свободу действий и автономию",
-            "d": "хорошие условия труда",
-        },
-    },
-    {
-        "num": 11,
-        "text": "Мне особенно важно:",
-        "options": {
-            "a": "иметь возможность применять свои способности",
-            "b": "иметь чёткую структуру обязанностей и процедур",
-            "c": "заниматься содержательной, интересной работой",
-            "d": "получать признание и уважение за результаты работы",
-        },
-    },
-    {
-        "num": 12,
-        "text": "Работа для меня — это прежде всего:",
-        "options": {
-            "a": "возможность достижения конкретных целей",
-            "b": "источник дохода и материального благополучия",
-            "c": "возможность получать дополнительные привилегии и льготы",
-            "d": "источник престижа и статуса",
-        },
-    },
-    {
-        "num": 13,
-        "text": "На работе я предпочитаю:",
-        "options": {
-            "a": "иметь чётко структурированные задачи",
-            "b": "чувствовать себя частью команды",
-            "c": "получать материальные вознаграждения за результаты",
-            "d": "иметь стабильные и безопасные условия труда",
-        },
-    },
-    {
-        "num": 14,
-        "text": "Для меня важно, чтобы работа:",
-        "options": {
-            "a": "была интересной и содержательной",
-            "b": "предоставляла автономию и свободу действий",
-            "c": "давалась с возможностью добиться признания и статуса",
-            "d": "обеспечивала высокий доход",
-        },
-    },
-    {
-        "num": 15,
-        "text": "Больше всего на работе я ценю:",
-        "options": {
-            "a": "возможность применять и развивать свои способности",
-            "b": "высокий доход и материальные поощрения",
-            "c": "признание и уважение со стороны окружающих",
-            "d": "ощущение значимости и общественной полезности своей работы",
-        },
-    },
-    {
-        "num": 16,
-        "text": "От работы я ожидаю:",
-        "options": {
-            "a": "возможности достигать сложных целей",
-            "b": "доброжелательных отношений в коллективе",
-            "c": "возможности расти и развиваться профессионально",
-            "d": "безопасных и комфортных условий труда",
-        },
-    },
-    {
-        "num": 17,
-        "text": "Для меня важно, чтобы на работе:",
-        "options": {
-            "a": "были чётко прописаны обязанности",
-            "b": "были понятны правила и процедуры",
-            "c": "была возможность творчества",
-            "d": "была высокая степень самостоятельности",
-        },
-    },
-    {
-        "num": 18,
-        "text": "Я предпочитаю работу, которая:",
-        "options": {
-            "a": "обеспечивает спокойствие и стабильность",
-            "b": "даёт ощущение разнообразия и новых впечатлений",
-            "c": "даёт возможности для общественно полезной деятельности",
-            "d": "приносит ощутимый материальный доход",
-        },
-    },
-    {
-        "num": 19,
-        "text": "Работа должна прежде всего:",
-        "options": {
-            "a": "быть чётко спланированной и структурированной",
-            "b": "быть интересной по содержанию",
-            "c": "давать возможность достигать значимых целей",
-            "d": "создавать условия для творчества",
-        },
-    },
-    {
-        "num": 20,
-        "text": "В работе меня особенно привлекает:",
-        "options": {
-            "a": "возможность применять свои знания и умения",
-            "b": "достойный доход",
-            "c": "признание моих достижений",
-            "d": "наличие разных льгот и бонусов",
-        },
-    },
-    {
-        "num": 21,
-        "text": "Для меня важно:",
-        "options": {
-            "a": "занимать престижную и уважаемую должность",
-            "b": "иметь стабильные условия работы",
-            "c": "иметь возможность творческой самореализации",
-            "d": "работать в команде единомышленников",
-        },
-    },
-    {
-        "num": 22,
-        "text": "Я особенно ценю в работе:",
-        "options": {
-            "a": "возможность ставить и достигать сложные цели",
-            "b": "доброжелательные отношения с коллегами",
-            "c": "свободу в выборе способов работы",
-            "d": "ощущение смысловой и общественной значимости работы",
-        },
-    },
-    {
-        "num": 23,
-        "text": "В своей работе я предпочту:",
-        "options": {
-            "a": "стабильную и гарантированную занятость",
-            "b": "возможность достигать заметных результатов",
-            "c": "быть вовлечённым в важные проекты",
-            "d": "иметь высокий уровень комфорта",
-        },
-    },
-    {
-        "num": 24,
-        "text": "Меня больше всего мотивирует:",
-        "options": {
-            "a": "получать признание и уважение окружающих",
-            "b": "иметь свободу действий и влияние на процессы",
-            "c": "достигать поставленных целей",
-            "d": "быть частью команды и коллектива",
-        },
-    },
-    {
-        "num": 25,
-        "text": "Я предпочитаю работу, которая:",
-        "options": {
-            "a": "чётко структурирована",
-            "b": "даёт ощущение разнообразия",
-            "c": "подразумевает командную деятельность",
-            "d": "обеспечивает хорошие условия труда",
-        },
-    },
-    {
-        "num": 26,
-        "text": "Для меня особенно важно, чтобы работа:",
-        "options": {
-            "a": "давала возможность хорошо зарабатывать",
-            "b": "была интересной по содержанию",
-            "c": "имела общественную значимость",
-            "d": "позволяла получить признание",
-        },
-    },
-    {
-        "num": 27,
-        "text": "В работе я особенно ценю:",
-        "options": {
-            "a": "возможность получать высокий доход",
-            "b": "возможность развивать свои способности",
-            "c": "интересное содержание деятельности",
-            "d": "комфортные условия труда",
-        },
-    },
-    {
-        "num": 28,
-        "text": "Для меня важно, чтобы в коллективе:",
-        "options": {
-            "a": "были хорошие условия труда",
-            "b": "была чёткая структура управления",
-            "c": "поддерживались хорошие отношения между коллегами",
-            "d": "было признание вкладов сотрудников",
-        },
-    },
-    {
-        "num": 29,
-        "text": "В работе я предпочитаю:",
-        "options": {
-            "a": "получать высокий доход",
-            "b": "иметь значительную степень самостоятельности",
-            "c": "участвовать в разнообразных проектах",
-            "d": "иметь возможность творчества",
-        },
-    },
-    {
-        "num": 30,
-        "text": "Меня привлекает работа, которая:",
-        "options": {
-            "a": "предусматривает разнообразие задач",
-            "b": "даёт возможность применять способности",
-            "c": "подразумевает тесное взаимодействие с коллегами",
-            "d": "предоставляет возможности для признания",
-        },
-    },
-    {
-        "num": 31,
-        "text": "Я буду особенно хорошо работать, если:",
-        "options": {
-            "a": "я буду точно знать, каких результатов от меня ожидают",
-            "b": "мне предоставят возможность расти и развиваться",
-            "c": "мои успехи будут замечены и вознаграждены",
-            "d": "условия работы будут благоприятны",
-        },
-    },
-    {
-        "num": 32,
-        "text": "Конфликт с руководителем или коллегами произойдёт, скорее всего, если:",
-        "options": {
-            "a": "они будут пытаться контролировать мою работу слишком плотно",
-            "b": "они будут несправедливо относиться ко мне или недооценивать мой вклад",
-            "c": "они будут препятствовать развитию и обучению",
-            "d": "мне не будут платить справедливо",
-        },
-    },
-    {
-        "num": 33,
-        "text": "Потеря работы для меня означала бы в первую очередь:",
-        "options": {
-            "a": "потерю экономической безопасности",
-            "b": "потерю ощущения полезности и значимости",
-            "c": "потерю возможности развиваться и применять свои способности",
-            "d": "потерю социального статуса и признания",
-        },
-    },
-]
+import numpy as np
 
-# Ключ подсчёта 12 факторов мотивационного профиля
-# Формат: factor_id -> list of (question_number, option_letter)
+from instruments import DEFAULT_VERSION, load_plan
 
-FACTOR_MAPPING = {
-    1: [(1, "a"), (3, "c"), (5, "c"), (9, "d"), (12, "c"), (13, "c"),
-        (14, "d"), (15, "b"), (18, "d"), (20, "b"), (26, "a"), (27, "a"),
-        (29, "a"), (32, "d")],
-    2: [(4, "d"), (5, "b"), (6, "a"), (7, "b"), (10, "d"), (13, "d"),
-        (16, "d"), (18, "a"), (25, "d"), (28, "a"), (31, "d")],
-    3: [(5, "a"), (11, "b"), (17, "a"), (17, "b"), (19, "a"),
-        (25, "a"), (31, "a")],
-    4: [(2, "b"), (10, "b"), (14, "a"), (16, "b"), (22, "b"),
-        (23, "a"), (24, "d"), (28, "c"), (30, "c")],
-    5: [(1, "c"), (2, "c"), (7, "a"), (9, "a"), (11, "d"), (12, "d"),
-        (14, "c"), (15, "c"), (20, "c"), (21, "a"), (24, "a"), (26, "d"),
-        (32, "b"), (33, "d")],
-    6: [(2, "d"), (4, "c"), (8, "b"), (9, "b"), (11, "c"), (14, "a"),
-        (15, "a"), (16, "c"), (19, "b"), (20, "a"), (27, "b"), (30, "b"),
-        (32, "c"), (33, "c")],
-    7: [(4, "c"), (6, "c"), (8, "c"), (11, "c"), (14, "a"), (15, "d"),
-        (19, "b"), (22, "d"), (26, "c"), (27, "b"), (30, "b")],
-    8: [(1, "d"), (8, "a"), (18, "b"), (22, "a"), (24, "b"),
-        (25, "b"), (29, "c"), (30, "a")],
-    9: [(1, "b"), (2, "c"), (10, "c"), (14, "b"), (17, "d"),
-        (24, "b"), (29, "b"), (32, "a")],
-    10: [(7, "d"), (8, "b"), (12, "a"), (14, "c"), (16, "a"),
-         (19, "c"), (22, "a"), (23, "b"), (23, "c"), (24, "c")],
-    11: [(8, "d"), (14, "b"), (24, "b"), (29, "c"), (30, "a"),
-         (32, "a")],
-    12: [(6, "c"), (6, "d"), (8, "c"), (9, "c"), (14, "a"), (15, "d"),
-         (22, "d"), (26, "c"), (27, "b"), (33, "b")],
-}
+DEFAULT_PLAN = load_plan(DEFAULT_VERSION)
 
-FACTOR_NAMES = {
-    1: "Высокий доход и материальное вознаграждение",
-    2: "Хорошие условия труда и физическая безопасность",
-    3: "Чёткая структура и порядок",
-    4: "Хорошие взаимоотношения с коллегами",
-    5: "Признание и статус",
-    6: "Возможность применить свои способности",
-    7: "Интересная и содержательная работа",
-    8: "Разнообразие и стимуляция",
-    9: "Автономия и независимость",
-    10: "Достижение целей и результатов",
-    11: "Творческий подход и инновации",
-    12: "Общественная полезность и служение",
-}
+QUESTIONS = DEFAULT_PLAN.questions
+FACTOR_MAPPING = DEFAULT_PLAN.factor_mapping
+FACTOR_NAMES = DEFAULT_PLAN.factor_names
+OPTION_LETTERS = DEFAULT_PLAN.option_letters
+POINTS_PER_QUESTION = DEFAULT_PLAN.points_per_question
+FACTOR_IDS = DEFAULT_PLAN.factor_ids
 
+# Плотная матрица весов формы (число_вопросов * 4, число_факторов):
+# строка — пара (вопрос, вариант), столбец — фактор в порядке FACTOR_IDS
+WEIGHT_MATRIX = DEFAULT_PLAN.weights
 
-def calculate_factors(answers):
+# Максимально возможный балл фактора: не больше 11 баллов с каждого вопроса,
+# варианты которого входят в ключ фактора
+MAX_FACTOR_SCORES = DEFAULT_PLAN.max_factor_scores
+
+
+def answers_to_array(answers, plan=DEFAULT_PLAN):
     """
     answers: dict {(q_num, option_letter) -> int_points}
+    Возвращает массив формы (33, 4) в порядке вопросов и вариантов плана.
+    """
+    return plan.answers_to_array(answers)
+
+
+def question_sums(answers_array):
+    """
+    answers_array: массив формы (..., 33, 4).
+    Возвращает суммы баллов по каждому вопросу, форма (..., 33);
+    в корректно заполненном опроснике каждая сумма равна POINTS_PER_QUESTION.
+    """
+    return np.asarray(answers_array).sum(axis=-1)
+
+
+def invalid_questions(answers, plan=DEFAULT_PLAN):
+    """
+    Вопросы с неверной суммой баллов: список (q_num, сумма).
+    answers: массив (33, 4), упакованные байты или dict, как в calculate_factors.
+    """
+    sums = question_sums(plan.as_array(answers).astype(np.int32, copy=False))
+    return [
+        (plan.questions[i]["num"], int(sums[i]))
+        for i in np.flatnonzero(sums != plan.points_per_question)
+    ]
+
+
+def calculate_factors_batch(answers_array, plan=DEFAULT_PLAN):
+    """
+    answers_array: массив формы (N, 33, 4) — баллы N респондентов
+    в порядке вопросов и вариантов плана.
+    Возвращает массив формы (N, 12): баллы факторов в порядке FACTOR_IDS.
+    """
+    return plan.calculate_batch(answers_array)
+
+
+def calculate_factors(answers, plan=DEFAULT_PLAN):
+    """
+    answers: массив (33, 4) в порядке вопросов и вариантов (в сессии — uint8),
+    те же 132 балла упакованными байтами или dict {(q_num, option_letter) -> int_points}
     Возвращает dict {factor_id: score}
     """
-    factor_scores = {fid: 0 for fid in FACTOR_MAPPING.keys()}
-    for fid, items in FACTOR_MAPPING.items():
-        total = 0
-        for q_num, opt in items:
-            total += answers.get((q_num, opt), 0)
-        factor_scores[fid] = total
-    return factor_scores
+    scores = plan.calculate_batch(plan.as_array(answers)[np.newaxis])[0]
+    return {fid: int(score) for fid, score in zip(plan.factor_ids, scores)}
@@ -0,0 +1,203 @@
+# similarity.py
+# Поиск похожих и «дополняющих» профилей среди сохранённых результатов.
+# Векторы 12 факторов лежат в одной непрерывной матрице float32, которая
+# держится в памяти процесса и при новых записях только дочитывается
+# (store.read_after), поэтому запрос — пара матрично-векторных умножений.
+#
+# Похожесть:
+#   euclidean — расстояние между векторами баллов;
+#   cosine    — косинус между отклонениями от среднего по группе
+#               (сырые баллы все положительны, и косинус между ними почти
+#               всегда близок к 1, а отклонения показывают форму профиля).
+# «Дополняющий» профиль — ближайший к зеркальному: 2·среднее − баллы,
+# то есть сильные стороны соседа приходятся на слабые стороны запроса.
+#
+#   python similarity.py --name Иван --k 5 --metric cosine --complementary
+
+import argparse
+import os
+import threading
+
+import numpy as np
+
+from scoring import FACTOR_IDS
+from storage import (
+    BACKENDS, COHORT_COLUMNS, FACTOR_COLUMNS, StaleCursorError, lazy_pandas, open_store,
+)
+
+METRICS = ("cosine", "euclidean")
+_INFO_COLUMNS = ["timestamp", "name"] + COHORT_COLUMNS
+
+
+class ProfileIndex:
+    """Матрица профилей (N, 12) с запасом ёмкости и атрибутами строк."""
+
+    def __init__(self):
+        self._buf = np.empty((0, len(FACTOR_IDS)), dtype=np.float32)
+        self._sq = np.empty(0, dtype=np.float32)
+        self.size = 0
+        self.info = {col: [] for col in _INFO_COLUMNS}
+        self.sums = np.zeros(len(FACTOR_IDS), dtype=np.float64)
+        self.cursor = 0
+        self.version = None
+        self.generation = None
+        # extend() из другой сессии может сдвинуть size и заменить буферы:
+        # запросы берут согласованный снимок под этой блокировкой
+        self._lock = threading.Lock()
+
+    @property
+    def matrix(self):
+        return self._buf[:self.size]
+
+    def snapshot(self):
+        """
+        Согласованные (матрица, квадраты норм, атрибуты, суммы) на текущий
+        размер. Списки атрибутов только дописываются, поэтому индексы
+        строк снимка в них остаются верными и без копирования.
+        """
+        with self._lock:
+            size = self.size
+            return self._buf[:size], self._sq[:size], self.info, self.sums.copy()
+
+    def extend(self, df):
+        """Дописывает строки результатов (DataFrame) в конец матрицы."""
+        n = len(df)
+        if not n:
+            return
+        with self._lock:
+            self._extend(df, n)
+
+    def _extend(self, df, n):
+        if self.size + n > len(self._buf):
+            capacity = max(self.size + n, 2 * len(self._buf), 1024)
+            buf = np.empty((capacity, len(FACTOR_IDS)), dtype=np.float32)
+            buf[:self.size] = self.matrix
+            sq = np.empty(capacity, dtype=np.float32)
+            sq[:self.size] = self._sq[:self.size]
+            self._buf, self._sq = buf, sq
+        block = df[FACTOR_COLUMNS].to_numpy(dtype=np.float32)
+        self._buf[self.size:self.size + n] = block
+        self._sq[self.size:self.size + n] = np.einsum("ij,ij->i", block, block)
+        self.sums += block.sum(axis=0, dtype=np.float64)
+        for col in _INFO_COLUMNS:
+            values = df[col] if col in df else lazy_pandas().Series([None] * n)
+            self.info[col].extend(values.astype(object).where(values.notna(), None).tolist())
+        self.size += n
+
+    def mean(self):
+        X, _, _, sums = self.snapshot()
+        return (sums / len(X)).astype(np.float32)
+
+    def scores(self, query, metric="cosine", snapshot=None):
+        """
+        Похожесть каждой строки на query (12 баллов): для cosine — косинус
+        отклонений от среднего (больше — ближе), для euclidean — минус расстояние.
+        """
+        X, sq, _, sums = snapshot or self.snapshot()
+        q = np.asarray(query, dtype=np.float32)
+        if metric == "euclidean":
+            d2 = sq - 2 * (X @ q) + q @ q
+            return -np.sqrt(np.maximum(d2, 0))
+        if metric != "cosine":
+            raise ValueError(f"неизвестная метрика: {metric}")
+        # (X - m)·(q - m) и |X - m| без построения центрированной матрицы
+        m = (sums / len(X)).astype(np.float32)
+        qc = q - m
+        dots = X @ qc - m @ qc
+        norms = np.sqrt(np.maximum(sq - 2 * (X @ m) + m @ m, 0))
+        qn = np.linalg.norm(qc)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sim = dots / (norms * qn)
+        return np.nan_to_num(sim, nan=0.0)
+
+    def query(self, factor_scores, k=5, metric="cosine", complementary=False, exclude_name=None):
+        """
+        k ближайших профилей к factor_scores ({factor_id: балл}).
+        complementary=True ищет ближайших к зеркальному профилю;
+        exclude_name исключает собственные результаты: строки с этим именем
+        и теми же баллами, что и запрос.
+        Возвращает DataFrame: атрибуты строки, похожесть/расстояние и баллы.
+        """
+        snapshot = self.snapshot()
+        X, _, info, sums = snapshot
+        if not len(X):
+            return lazy_pandas().DataFrame(columns=_INFO_COLUMNS + ["similarity"] + FACTOR_COLUMNS)
+        own = np.array([factor_scores[fid] for fid in FACTOR_IDS], dtype=np.float32)
+        q = 2 * (sums / len(X)).astype(np.float32) - own if complementary else own
+        sim = self.scores(q, metric, snapshot)
+        if exclude_name is not None:
+            same = np.flatnonzero((X == own).all(axis=1))
+            sim[[i for i in same if info["name"][i] == exclude_name]] = -np.inf
+        k = min(k, len(X))
+        top = np.argpartition(-sim, k - 1)[:k]
+        top = top[np.argsort(-sim[top], kind="stable")]
+        top = top[np.isfinite(sim[top])]
+        out = {col: [info[col][i] for i in top] for col in _INFO_COLUMNS}
+        if metric == "cosine":
+            out["similarity"] = sim[top].astype(np.float64).round(3)
+        else:
+            out["distance"] = (-sim[top]).astype(np.float64).round(3)
+        out.update(zip(FACTOR_COLUMNS, X[top].astype(int).T))
+        return lazy_pandas().DataFrame(out)
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_index(store):
+    """Индекс профилей хранилища: дочитывает только новые строки."""
+    with _lock:
+        index = _indexes.get(store.path)
+        version = store.version()
+        if index is not None and index.version == version:
+            return index
+        generation = store.generation()
+        if index is None or index.generation != generation:
+            index = ProfileIndex()
+        try:
+            df, cursor = store.read_after(index.cursor)
+        except StaleCursorError:
+            # файл переписан на месте: индекс строится заново
+            index = ProfileIndex()
+            df, cursor = store.read_after(0)
+        index.extend(df)
+        index.cursor, index.version, index.generation = cursor, version, generation
+        _indexes[store.path] = index
+        return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Похожие и дополняющие профили")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--name", help="имя респондента (берётся его последний результат)")
+    group.add_argument("--scores", help="12 баллов через запятую в порядке факторов")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--metric", choices=METRICS, default="cosine")
+    parser.add_argument("--complementary", action="store_true", help="искать дополняющие профили")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=os.environ.get("RESULTS_BACKEND", "csv"))
+    parser.add_argument("--path", default=os.environ.get("RESULTS_PATH"), help="путь к хранилищу")
+    args = parser.parse_args(argv)
+
+    index = get_index(open_store(args.backend, args.path))
+    if args.scores:
+        values = [int(v) for v in args.scores.split(",")]
+        if len(values) != len(FACTOR_IDS):
+            parser.error(f"--scores: нужно {len(FACTOR_IDS)} чисел")
+        exclude = None
+    else:
+        rows = [i for i, name in enumerate(index.info["name"]) if name == args.name]
+        if not rows:
+            parser.error(f"нет результатов для имени {args.name!r}")
+        values = index.matrix[rows[-1]].astype(int).tolist()
+        exclude = args.name
+    result = index.query(
+        dict(zip(FACTOR_IDS, values)), k=args.k, metric=args.metric,
+        complementary=args.complementary, exclude_name=exclude,
+    )
+    with lazy_pandas().option_context("display.max_columns", None, "display.width", 200):
+        print(result.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,553 @@
+# storage.py
+# Хранилище результатов опросника: CSV (по умолчанию) или SQLite.
+# Бэкенд выбирается переменными окружения RESULTS_BACKEND (csv | sqlite)
+# и RESULTS_PATH; CSV остаётся форматом импорта/экспорта.
+# pandas (lazy_pandas) и pyarrow (через columnar) загружаются при первом
+# чтении: дозапись результата и проверка версии обходятся без них.
+
+import argparse
+import contextlib
+import csv
+import functools
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from instruments import DEFAULT_VERSION
+from scoring import FACTOR_IDS, FACTOR_NAMES
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def lazy_pandas():
+    """
+    Модуль pandas, импортируемый при первом обращении (около 0,5 с):
+    холодный старт приложения и открытие опросника его не загружают.
+    """
+    import pandas
+
+    return pandas
+
+
+RESULTS_FILE = "results.csv"
+RESULTS_DB = "results.db"
+
+FACTOR_COLUMNS = [FACTOR_NAMES[fid] for fid in FACTOR_IDS]
+# необязательные атрибуты подгруппы, указываемые при прохождении теста
+COHORT_COLUMNS = ["faculty", "level"]
+COHORT_LABELS = {"faculty": "Факультет", "level": "Уровень"}
+# при чтении CSV атрибуты подгруппы остаются строками ("01" не становится 1)
+COHORT_DTYPES = {col: str for col in COHORT_COLUMNS}
+LEVELS = ["N", "N-1", "N-2", "N-3", "N-4 и ниже"]
+# версия опросника (instruments/<версия>.json), по которой посчитан результат
+INSTRUMENT_COLUMN = "instrument"
+LEGACY_COLUMNS = ["timestamp", "name"] + FACTOR_COLUMNS
+RESULT_COLUMNS = LEGACY_COLUMNS + COHORT_COLUMNS + [INSTRUMENT_COLUMN]
+# чем заполняются столбцы, которых нет в файлах и базах старого формата
+MIGRATION_DEFAULTS = {INSTRUMENT_COLUMN: DEFAULT_VERSION}
+
+
+@contextlib.contextmanager
+def _locked(f):
+    """Эксклюзивная блокировка открытого файла на время записи."""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Межпроцессная блокировка через вспомогательный файл <path>.lock."""
+    with open(path + ".lock", "a+b") as f:
+        with _locked(f):
+            yield
+
+
+def _fsync_dir(path):
+    """Фиксирует на диске запись о новом файле в каталоге (только POSIX)."""
+    if fcntl is None:
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _encode_rows(rows, columns, header):
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    if header:
+        writer.writerow(columns)
+    for row in rows:
+        writer.writerow([row.get(col, "") for col in columns])
+    return buf.getvalue().encode("utf-8")
+
+
+def append_rows(path, rows, columns=RESULT_COLUMNS):
+    """
+    Дописывает строки в конец CSV под файловой блокировкой за O(1)
+    относительно размера файла. Заголовок пишется, только если файл пуст.
+    rows: список dict {column -> value}
+    """
+    created = not os.path.exists(path)
+    with open(path, "a+b") as f:
+        with _locked(f):
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            data = _encode_rows(rows, columns, header=size == 0)
+            if size > 0:
+                # файл мог быть отредактирован вручную без перевода строки в конце
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data
+                f.seek(0, os.SEEK_END)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+    if created:
+        _fsync_dir(path)
+
+
+def migrate_csv(path):
+    """
+    Дописывает к CSV старого формата (без столбцов подгруппы и/или версии
+    опросника) недостающие столбцы RESULT_COLUMNS: пустые или со значением
+    из MIGRATION_DEFAULTS. Файл переписывается на месте под той же
+    блокировкой, что и дозапись, поэтому параллельные записи не теряются.
+    Возвращает True, если миграция выполнялась.
+    """
+    if not os.path.exists(path):
+        return False
+    with open(path, "r+b") as f:
+        with _locked(f):
+            header = next(csv.reader([f.readline().decode("utf-8").rstrip("\r\n")]), [])
+            if (
+                len(header) < len(LEGACY_COLUMNS)
+                or len(header) >= len(RESULT_COLUMNS)
+                or header != RESULT_COLUMNS[:len(header)]
+            ):
+                return False
+            pad = "".join(
+                "," + MIGRATION_DEFAULTS.get(col, "") for col in RESULT_COLUMNS[len(header):]
+            ).encode("utf-8")
+            with tempfile.TemporaryFile() as tmp:
+                tmp.write(",".join(RESULT_COLUMNS).encode("utf-8") + b"\n")
+                for line in f:
+                    line = line.rstrip(b"\r\n")
+                    if line:
+                        tmp.write(line + pad + b"\n")
+                tmp.seek(0)
+                f.seek(0)
+                f.truncate()
+                shutil.copyfileobj(tmp, f)
+            f.flush()
+            os.fsync(f.fileno())
+    return True
+
+
+class StaleCursorError(ValueError):
+    """Курсор read_after не подходит к файлу: файл заменён или переписан."""
+
+
+def _prefix_upper_bound(prefix):
+    """Минимальная строка, большая всех строк с данным префиксом."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _filter_frame(df, name_prefix=None, since=None, until=None, faculty=None, level=None,
+                  instrument=None):
+    """
+    Фильтры дашборда поверх DataFrame: префикс имени, диапазон дат (ISO)
+    и точное совпадение атрибутов подгруппы и версии опросника.
+    """
+    if name_prefix:
+        df = df[df["name"].astype(str).str.startswith(name_prefix)]
+    if since:
+        df = df[df["timestamp"] >= since]
+    if until:
+        df = df[df["timestamp"] < until]
+    for col, value in (("faculty", faculty), ("level", level), (INSTRUMENT_COLUMN, instrument)):
+        if value:
+            df = df[df[col].astype(str) == value]
+    return df
+
+
+def _frame_stats(df):
+    values = df[FACTOR_COLUMNS].to_numpy(dtype="int64")
+    if not len(values):
+        n = len(FACTOR_IDS)
+        return {"count": 0, "sums": [0] * n, "sumsq": [0] * n, "mins": [None] * n, "maxs": [None] * n}
+    return {
+        "count": len(values),
+        "sums": values.sum(axis=0).tolist(),
+        "sumsq": (values * values).sum(axis=0).tolist(),
+        "mins": values.min(axis=0).tolist(),
+        "maxs": values.max(axis=0).tolist(),
+    }
+
+
+class CsvResultsStore:
+    """Результаты в одном CSV-файле; агрегаты считаются через pandas."""
+
+    def __init__(self, path=RESULTS_FILE):
+        self.path = path
+        migrate_csv(path)
+
+    def append(self, rows):
+        append_rows(self.path, [{INSTRUMENT_COLUMN: DEFAULT_VERSION, **row} for row in rows])
+
+    def load(self, **filters):
+        from columnar import compact_frame, load_csv_compact
+
+        if not os.path.exists(self.path):
+            return compact_frame(lazy_pandas().DataFrame(columns=RESULT_COLUMNS))
+        df = load_csv_compact(self.path, RESULT_COLUMNS)
+        return _filter_frame(df, **filters).reset_index(drop=True)
+
+    def iter_chunks(self, chunksize=50_000, **filters):
+        if not os.path.exists(self.path):
+            return
+        for chunk in lazy_pandas().read_csv(self.path, chunksize=chunksize, dtype=COHORT_DTYPES):
+            chunk = _filter_frame(chunk, **filters)
+            if not chunk.empty:
+                yield chunk
+
+    def read_after(self, cursor=0):
+        """
+        Строки, дописанные после курсора (смещение в байтах; 0 — с начала
+        файла), и новый курсор. Читаются только целые строки. Курсор годен,
+        пока не изменилась generation(); курсор за концом файла —
+        StaleCursorError.
+        """
+        if not os.path.exists(self.path):
+            return lazy_pandas().DataFrame(columns=RESULT_COLUMNS), 0
+        with open(self.path, "rb") as f:
+            if cursor > os.fstat(f.fileno()).st_size:
+                raise StaleCursorError(f"{self.path}: курсор {cursor} за концом файла")
+            f.seek(cursor)
+            data = f.read()
+        data = data[:data.rfind(b"\n") + 1]
+        if not data.strip():
+            return lazy_pandas().DataFrame(columns=RESULT_COLUMNS), cursor + len(data)
+        df = lazy_pandas().read_csv(
+            io.BytesIO(data), header=0 if cursor == 0 else None,
+            names=None if cursor == 0 else RESULT_COLUMNS, encoding="utf-8", dtype=COHORT_DTYPES,
+        )
+        return df, cursor + len(data)
+
+    def count(self, **filters):
+        return len(self.load(**filters))
+
+    def version(self):
+        """Метка версии данных: меняется при каждой дозаписи."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return "0"
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    def generation(self):
+        """
+        Метка файла для курсоров read_after: меняется, если файл заменён
+        (другой inode) или переписан с другим заголовком (migrate_csv).
+        """
+        try:
+            with open(self.path, "rb") as f:
+                return f"{os.fstat(f.fileno()).st_ino}:{len(f.readline())}"
+        except FileNotFoundError:
+            return "0"
+
+    def factor_means(self, **filters):
+        """Средние по факторам: dict {factor_id: mean}; пустой, если строк нет."""
+        df = self.load(**filters)
+        if df.empty:
+            return {}
+        means = df[FACTOR_COLUMNS].mean()
+        return {fid: float(means[FACTOR_NAMES[fid]]) for fid in FACTOR_IDS}
+
+    def factor_stats(self, **filters):
+        """count/sums/sumsq/mins/maxs по факторам (формат FactorStats.to_dict)."""
+        return _frame_stats(self.load(**filters))
+
+    def page(self, offset=0, limit=50, sort_by="timestamp", descending=True, **filters):
+        """Одна страница строк с сортировкой по любому столбцу результатов."""
+        if sort_by not in RESULT_COLUMNS:
+            raise ValueError(f"неизвестный столбец сортировки: {sort_by}")
+        df = self.load(**filters)
+        df = df.sort_values(sort_by, ascending=not descending, kind="stable")
+        return df.iloc[offset:offset + limit].reset_index(drop=True)
+
+
+class SqliteResultsStore:
+    """
+    Результаты в SQLite (режим WAL): баллы факторов — целочисленные столбцы
+    f1..f12, фильтрация и агрегация выполняются на стороне SQL.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS results ("
+        "id INTEGER PRIMARY KEY, "
+        "timestamp TEXT NOT NULL, "
+        "name TEXT NOT NULL, "
+        + ", ".join(f"f{fid} INTEGER NOT NULL" for fid in FACTOR_IDS)
+        + ")",
+        "CREATE INDEX IF NOT EXISTS idx_results_timestamp ON results(timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_results_name ON results(name)",
+    )
+
+    def __init__(self, path=RESULTS_DB):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for stmt in self.SCHEMA:
+                conn.execute(stmt)
+            # миграция баз без столбцов подгруппы и версии опросника
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(results)")}
+            for col in COHORT_COLUMNS:
+                if col not in existing:
+                    conn.execute(f"ALTER TABLE results ADD COLUMN {col} TEXT")
+            if INSTRUMENT_COLUMN not in existing:
+                conn.execute(
+                    f"ALTER TABLE results ADD COLUMN {INSTRUMENT_COLUMN} TEXT NOT NULL "
+                    f"DEFAULT '{DEFAULT_VERSION}'"
+                )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _where(name_prefix=None, since=None, until=None, faculty=None, level=None,
+               instrument=None):
+        clauses, params = [], []
+        if name_prefix:
+            # диапазон вместо LIKE, чтобы использовался индекс idx_results_name
+            clauses.append("name >= ? AND name < ?")
+            params += [name_prefix, _prefix_upper_bound(name_prefix)]
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        for col, value in (("faculty", faculty), ("level", level), (INSTRUMENT_COLUMN, instrument)):
+            if value:
+                clauses.append(f"{col} = ?")
+                params.append(value)
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        return where, params
+
+    def _select(self, with_id=False):
+        cols = ", ".join(f'f{fid} AS "{FACTOR_NAMES[fid]}"' for fid in FACTOR_IDS)
+        head = "id, timestamp" if with_id else "timestamp"
+        tail = ", ".join(COHORT_COLUMNS + [INSTRUMENT_COLUMN])
+        return f"SELECT {head}, name, {cols}, {tail} FROM results"
+
+    def append(self, rows):
+        fcols = [f"f{fid}" for fid in FACTOR_IDS] + COHORT_COLUMNS + [INSTRUMENT_COLUMN]
+        sql = (
+            f"INSERT INTO results (timestamp, name, {', '.join(fcols)}) "
+            f"VALUES ({', '.join('?' * (len(fcols) + 2))})"
+        )
+        with self._connect() as conn:
+            conn.executemany(
+                sql,
+                [
+                    [row["timestamp"], row["name"]]
+                    + [int(row[FACTOR_NAMES[fid]]) for fid in FACTOR_IDS]
+                    + [row.get(col) or None for col in COHORT_COLUMNS]
+                    + [row.get(INSTRUMENT_COLUMN) or DEFAULT_VERSION]
+                    for row in rows
+                ],
+            )
+
+    def load(self, **filters):
+        from columnar import compact_frame
+
+        where, params = self._where(**filters)
+        with self._connect() as conn:
+            return compact_frame(lazy_pandas().read_sql_query(
+                self._select() + where + " ORDER BY id", conn, params=params
+            ))
+
+    def iter_chunks(self, chunksize=50_000, **filters):
+        where, params = self._where(**filters)
+        with self._connect() as conn:
+            yield from lazy_pandas().read_sql_query(
+                self._select() + where + " ORDER BY id",
+                conn,
+                params=params,
+                chunksize=chunksize,
+            )
+
+    def read_after(self, cursor=0):
+        """Строки с id больше курсора и новый курсор (последний id)."""
+        with self._connect() as conn:
+            df = lazy_pandas().read_sql_query(
+                self._select(with_id=True) + " WHERE id > ? ORDER BY id",
+                conn, params=[int(cursor)],
+            )
+        if df.empty:
+            return df.drop(columns="id"), cursor
+        return df.drop(columns="id"), int(df["id"].iloc[-1])
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM results" + where, params).fetchone()[0]
+
+    def version(self):
+        """Метка версии данных: последний id (таблица только дописывается)."""
+        with self._connect() as conn:
+            max_id = conn.execute("SELECT MAX(id) FROM results").fetchone()[0]
+        return str(max_id or 0)
+
+    def generation(self):
+        """Метка файла базы для курсоров read_after (id только растут, пока файл тот же)."""
+        try:
+            return str(os.stat(self.path).st_ino)
+        except FileNotFoundError:
+            return "0"
+
+    def factor_means(self, **filters):
+        where, params = self._where(**filters)
+        avgs = ", ".join(f"AVG(f{fid})" for fid in FACTOR_IDS)
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT COUNT(*), {avgs} FROM results" + where, params
+            ).fetchone()
+        if not row[0]:
+            return {}
+        return {fid: float(mean) for fid, mean in zip(FACTOR_IDS, row[1:])}
+
+    def factor_stats(self, **filters):
+        """count/sums/sumsq/mins/maxs по факторам (формат FactorStats.to_dict)."""
+        where, params = self._where(**filters)
+        n = len(FACTOR_IDS)
+        exprs = (
+            [f"SUM(f{fid})" for fid in FACTOR_IDS]
+            + [f"SUM(f{fid} * f{fid})" for fid in FACTOR_IDS]
+            + [f"MIN(f{fid})" for fid in FACTOR_IDS]
+            + [f"MAX(f{fid})" for fid in FACTOR_IDS]
+        )
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT COUNT(*), {', '.join(exprs)} FROM results" + where, params
+            ).fetchone()
+        vals = row[1:]
+        return {
+            "count": row[0],
+            "sums": [v or 0 for v in vals[:n]],
+            "sumsq": [v or 0 for v in vals[n:2 * n]],
+            "mins": list(vals[2 * n:3 * n]),
+            "maxs": list(vals[3 * n:]),
+        }
+
+    def page(self, offset=0, limit=50, sort_by="timestamp", descending=True, **filters):
+        """
+        Одна страница строк: LIMIT/OFFSET на стороне SQL. Сортировка по
+        timestamp и name идёт по индексам, по остальным — через top-N сортировку.
+        """
+        from columnar import compact_frame
+
+        if sort_by not in RESULT_COLUMNS:
+            raise ValueError(f"неизвестный столбец сортировки: {sort_by}")
+        order_col = f"f{FACTOR_IDS[FACTOR_COLUMNS.index(sort_by)]}" if sort_by in FACTOR_COLUMNS else sort_by
+        direction = "DESC" if descending else "ASC"
+        where, params = self._where(**filters)
+        with self._connect() as conn:
+            return compact_frame(lazy_pandas().read_sql_query(
+                self._select() + where
+                + f" ORDER BY {order_col} {direction}, id {direction} LIMIT ? OFFSET ?",
+                conn,
+                params=params + [int(limit), int(offset)],
+            ))
+
+
+BACKENDS = {
+    "csv": (CsvResultsStore, RESULTS_FILE),
+    "sqlite": (SqliteResultsStore, RESULTS_DB),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def open_store(backend="csv", path=None):
+    cls, default_path = BACKENDS[backend]
+    return cls(path or default_path)
+
+
+def get_store():
+    """Хранилище, выбранное через RESULTS_BACKEND / RESULTS_PATH."""
+    return open_store(
+        os.environ.get("RESULTS_BACKEND", "csv"), os.environ.get("RESULTS_PATH")
+    )
+
+
+def import_csv(store, csv_path, chunksize=50_000):
+    """Загружает results.csv в хранилище порциями; возвращает число строк."""
+    total = 0
+    for chunk in lazy_pandas().read_csv(csv_path, chunksize=chunksize, dtype=COHORT_DTYPES):
+        # в CSV старого формата столбцов подгруппы и версии опросника нет
+        chunk = chunk.reindex(columns=RESULT_COLUMNS)
+        chunk[INSTRUMENT_COLUMN] = chunk[INSTRUMENT_COLUMN].fillna(DEFAULT_VERSION)
+        chunk[COHORT_COLUMNS] = chunk[COHORT_COLUMNS].astype(object).where(chunk[COHORT_COLUMNS].notna(), None)
+        rows = chunk.to_dict("records")
+        store.append(rows)
+        total += len(rows)
+    return total
+
+
+def export_csv(store, csv_path, **filters):
+    """Выгружает результаты в CSV порциями (export.write_csv); возвращает число строк."""
+    from export import write_csv
+
+    with open(csv_path, "wb") as f:
+        return write_csv(store, f, **filters)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Импорт/экспорт результатов опросника")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_imp = sub.add_parser("import", help="CSV -> хранилище")
+    p_imp.add_argument("csv_path")
+    p_exp = sub.add_parser("export", help="хранилище -> CSV")
+    p_exp.add_argument("csv_path")
+    for p in (p_imp, p_exp):
+        p.add_argument("--backend", choices=sorted(BACKENDS), default="sqlite")
+        p.add_argument("--path", default=None, help="путь к хранилищу")
+    args = parser.parse_args(argv)
+
+    store = open_store(args.backend, args.path)
+    if args.command == "import":
+        n = import_csv(store, args.csv_path)
+    else:
+        n = export_csv(store, args.csv_path)
+    print(f"{args.command}: {n} строк")
+
+
+if __name__ == "__main__":
+    main()
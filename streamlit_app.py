@@ -1,185 +1,662 @@
 # streamlit_app.py
-import os
 import datetime
+import os
+import re
 
-import pandas as pd
+import numpy as np
 import streamlit as st
-import plotly.graph_objects as go
 
-from fpdf import FPDF
+from instruments import DEFAULT_VERSION, available_versions, load_plan, valid_versions
+from scoring import (
+    FACTOR_IDS,
+    FACTOR_NAMES,
+    calculate_factors,
+    invalid_questions,
+    question_sums,
+)
+from charts import (
+    bar_figure, bar_png, radar_figure, radar_multi_figure, radar_png, score_key, trend_figure, trend_png,
+)
+from report import build_pdf_report, build_team_report
+from storage import (
+    COHORT_COLUMNS, COHORT_LABELS, INSTRUMENT_COLUMN, LEVELS, RESULT_COLUMNS, get_store, lazy_pandas,
+)
+from aggregates import FactorStats, get_aggregates, get_histogram
+from similarity import METRICS, get_index
+from archetypes import get_model
+import telemetry
+from telemetry import span
+from writer import submit_result
+import export
+
+
+def session_id():
+    """id текущей сессии Streamlit (для меток замеров); вне сервера — None."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+
+def load_results(**filters):
+    with span("load_results", session_id()) as s:
+        df = get_store().load(**filters)
+        s["rows"] = len(df)
+    return df
+
+
+# сколько отправка формы ждёт подтверждения записи от фонового писателя
+ACK_WAIT = 1.0
+
+
+def save_result(name, factor_scores, cohort=None, instrument=DEFAULT_VERSION):
+    """
+    Ставит результат в очередь фоновой записи (writer.py); возвращает Future,
+    который завершается после фиксации пачки со строкой.
+    """
+    row = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "name": name,
+        INSTRUMENT_COLUMN: instrument,
+    }
+    for fid, score in factor_scores.items():
+        row[FACTOR_NAMES[fid]] = score
+    row.update(cohort or {})
+    with span("save_result", session_id(), rows=1):
+        return submit_result(get_store(), row)
 
-from scoring import QUESTIONS, FACTOR_NAMES, calculate_factors
 
-FONT_PATH = "Roboto-Regular.ttf"  # файл шрифта в корне проекта
+def show_save_status(wait=0):
+    """
+    Подтверждение записи последнего результата сессии. True — записан,
+    False — ещё в очереди; ошибка записи показывается и сбрасывается.
+    """
+    future = st.session_state.get("pending_save")
+    if future is None:
+        return True
+    try:
+        future.result(timeout=wait)
+    except TimeoutError:
+        st.info("Ответы приняты и записываются — подтверждение появится при следующем обновлении страницы.")
+        return False
+    except Exception as e:
+        st.error(f"Не удалось сохранить результат: {e}. Отправьте ответы ещё раз.")
+        del st.session_state["pending_save"]
+        return False
+    del st.session_state["pending_save"]
+    return True
+
+
+def cohort_attributes():
+    """Необязательные атрибуты подгруппы из полей вкладки «Пройти тест»."""
+    return {
+        col: (st.session_state.get(f"cohort_{col}") or "").strip()
+        for col in COHORT_COLUMNS
+    }
 
-# Русские описания факторов для PDF
-FACTOR_DESCRIPTIONS_RU = {
-    1: "Для вас важна ощутимая связь между усилиями и вознаграждением. Высокий доход, премии и бонусы — значимый источник мотивации.",
-    2: "Вы цените стабильность, предсказуемость и безопасные условия труда. Сильный стресс и нестабильность снижают вашу мотивацию.",
-    3: "Вам комфортно, когда есть понятные правила, регламенты и структура. Неопределённость и хаос воспринимаются как демотиваторы.",
-    4: "Для вас важны хорошие отношения в команде, доверие и поддержка коллег. Конфликты и токсичная среда сильно снижают мотивацию.",
-    5: "Вам важно признание результатов, уважение и статус. Вы хотите, чтобы вклад был заметен и оценён.",
-    6: "Вас мотивирует возможность применять и развивать свои способности на содержательных задачах, а не «просто быть занятым».",
-    7: "Вы предпочитаете интересную, осмысленную работу, в которой есть интеллектуальный вызов, а не рутину ради процесса.",
-    8: "Вас заряжают разнообразие задач, новые проекты и перемены. Монотонная, однообразная работа быстро снижает мотивацию.",
-    9: "Для вас важна свобода в способах достижения результата. Избыточный контроль и микроменеджмент воспринимаются как давление.",
-    10: "Вас мотивируют амбициозные цели, измеримый результат и ощущение прогресса. Вам важно видеть, чего вы достигли.",
-    11: "Вам нравится придумывать новые решения, улучшать процессы и подходить к задачам творчески, а не работать «по инструкции».",
-    12: "Для вас важно чувствовать, что работа приносит реальную пользу людям и обществу, а не сводится только к формальному результату.",
-}
 
+def cohort_comparison_frame(breakdown):
+    """Таблица средних по факторам для каждой подгруппы из CohortCube.breakdown."""
+    rows = {}
+    for value, stats in breakdown.items():
+        means = stats.means()
+        rows[value or "не указано"] = {"Результатов": stats.count} | {
+            FACTOR_NAMES[fid]: round(means[fid], 1) for fid in FACTOR_IDS
+        }
+    return lazy_pandas().DataFrame.from_dict(rows, orient="index")
+
+
+def summary_frame(stats):
+    """Таблица mean/std/min/max по факторам из FactorStats."""
+    means, stds = stats.means(), stats.stds()
+    return lazy_pandas().DataFrame(
+        {
+            "Среднее": [round(means[fid], 1) for fid in FACTOR_NAMES],
+            "Ст. откл.": [round(stds[fid], 1) for fid in FACTOR_NAMES],
+            "Мин": stats.mins,
+            "Макс": stats.maxs,
+        },
+        index=[FACTOR_NAMES[fid] for fid in FACTOR_NAMES],
+    )
 
-def classify_level(score: int) -> str:
-    """0–34 низкий, 35–69 средний, 70+ высокий уровень фактора."""
-    if score >= 70:
-        return "высокий"
-    elif score >= 35:
-        return "средний"
-    return "низкий"
+
+def show_results_page(store, filters, count):
+    """Постраничный просмотр строк: из хранилища читается только видимая страница."""
+    cols = st.columns(4)
+    sort_by = cols[0].selectbox("Сортировка", RESULT_COLUMNS, index=0)
+    descending = cols[1].selectbox("Порядок", ["по убыванию", "по возрастанию"]) == "по убыванию"
+    page_size = cols[2].selectbox("Строк на странице", [25, 50, 100, 250], index=1)
+    n_pages = max(1, -(-count // page_size))
+    page_num = cols[3].number_input(
+        f"Страница (из {n_pages})", min_value=1, max_value=n_pages, value=1, step=1
+    )
+    with span("load_results", session_id()) as s:
+        page = store.page(
+            offset=(page_num - 1) * page_size,
+            limit=page_size,
+            sort_by=sort_by,
+            descending=descending,
+            **filters,
+        )
+        s["rows"] = len(page)
+    st.dataframe(page, use_container_width=True, hide_index=True)
 
 
-def build_pdf_report(name: str, factor_scores: dict) -> bytes:
+def show_export(store, filters, count):
     """
-    Формирует PDF с мотивационным профилем участника на русском языке
-    с использованием шрифта Roboto (поддержка кириллицы).
+    Выгрузка строк по фильтрам дашборда. Небольшие файлы собираются по
+    нажатию кнопки скачивания, большие — во временный файл в фоне.
     """
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-
-    # Подключаем шрифт Roboto как основной
-    pdf.add_font("Roboto", "", FONT_PATH, uni=True)
-    pdf.add_font("Roboto", "B", FONT_PATH, uni=True)
-
-    pdf.add_page()
-
-    # Заголовок
-    pdf.set_font("Roboto", "B", 16)
-    pdf.set_text_color(40, 40, 40)
-    pdf.cell(0, 10, "Мотивационный профиль (12 факторов)", ln=True)
-
-    pdf.set_font("Roboto", "", 12)
-    pdf.set_text_color(60, 60, 60)
-    pdf.cell(0, 7, f"Участник: {name}", ln=True)
-    pdf.ln(3)
-
-    pdf.set_font("Roboto", "", 10)
-    pdf.multi_cell(
-        0,
-        5,
-        "Чем выше значение фактора, тем больше он влияет на вашу мотивацию. "
-        "Уровни интерпретации: 0–34 — низкий, 35–69 — средний, 70 и более — высокий.",
+    fmt = st.radio(
+        "Формат", list(export.FORMATS), format_func=lambda f: export.FORMATS[f][0],
+        horizontal=True, key="export_format",
     )
-    pdf.ln(4)
-
-    # Таблица факторов
-    pdf.set_font("Roboto", "B", 11)
-    pdf.set_fill_color(230, 230, 230)
-    pdf.set_text_color(20, 20, 20)
+    label, mime = export.FORMATS[fmt]
+    export.expire_jobs()
+    job = st.session_state.get("export_job")
+    if job is not None and (job.served or job.expired() or not job.matches(fmt, filters)):
+        # файл уже отдан, устарел или собран для других фильтров — удаляем
+        job.discard()
+        job = st.session_state["export_job"] = None
+    if count <= export.BACKGROUND_ROWS:
+        st.download_button(
+            f"Скачать {label} ({count} строк)",
+            data=lambda: export.export_bytes(store, fmt, **filters),
+            file_name=export.file_name(fmt),
+            mime=mime,
+        )
+        return
 
-    pdf.cell(100, 8, "Фактор", border=1, fill=True)
-    pdf.cell(25, 8, "Баллы", border=1, fill=True, align="C")
-    pdf.cell(35, 8, "Уровень", border=1, fill=True, align="C")
-    pdf.ln(8)
+    if job is None:
+        if st.button(f"Подготовить {label} ({count} строк)"):
+            job = st.session_state["export_job"] = export.start_export(store, fmt, **filters)
+        else:
+            return
+    if not job.future.done():
+        st.info("Файл готовится в фоне — обновите, чтобы проверить.")
+        st.button("Обновить", key="export_refresh")
+    elif job.future.exception() is not None:
+        st.error(f"Не удалось подготовить файл: {job.future.exception()}")
+        st.session_state["export_job"] = None
+    else:
+        # файл читается только по нажатию, а не на каждом перезапуске
+        st.download_button(
+            f"Скачать {label} ({count} строк)", data=job.read,
+            file_name=export.file_name(fmt), mime=mime,
+        )
 
-    pdf.set_font("Roboto", "", 10)
-    pdf.set_text_color(40, 40, 40)
 
-    # факторы по убыванию значимости
-    for fid in sorted(factor_scores.keys(), key=lambda x: -factor_scores[x]):
-        score = factor_scores[fid]
-        level = classify_level(score)
-        fname = FACTOR_NAMES.get(fid, f"Фактор {fid}")
+def use_static_charts():
+    """Статические PNG вместо Plotly: переключатель в сайдбаре или ?static=1."""
+    return bool(st.session_state.get("static_charts")) or st.query_params.get("static") == "1"
 
-        pdf.cell(100, 7, fname, border=1)
-        pdf.cell(25, 7, str(score), border=1, align="C")
-        pdf.cell(35, 7, level, border=1, align="C")
-        pdf.ln(7)
 
-    pdf.ln(4)
+def show_radar_chart(factor_scores, title="Мотивационный профиль"):
+    key = score_key(factor_scores)
+    with span("charts", session_id(), rows=len(key)):
+        if use_static_charts():
+            st.image(radar_png(key, title))
+            st.caption("; ".join(f"{fid} — {FACTOR_NAMES[fid]}" for fid, _ in key))
+        else:
+            st.plotly_chart(radar_figure(key, title), use_container_width=True)
 
-    # Интерпретации
-    pdf.set_font("Roboto", "B", 12)
-    pdf.set_text_color(30, 30, 30)
-    pdf.cell(0, 8, "Интерпретация профиля:", ln=True)
-    pdf.ln(2)
 
-    for fid in sorted(factor_scores.keys(), key=lambda x: -factor_scores[x]):
-        score = factor_scores[fid]
-        level = classify_level(score)
-        fname = FACTOR_NAMES.get(fid, f"Фактор {fid}")
-        desc = FACTOR_DESCRIPTIONS_RU.get(fid, "")
+def show_bar_chart(factor_scores, title="12 факторов мотивации"):
+    key = score_key(factor_scores)
+    with span("charts", session_id(), rows=len(key)):
+        if use_static_charts():
+            st.image(bar_png(key, title))
+        else:
+            st.plotly_chart(bar_figure(key, title), use_container_width=True)
 
-        pdf.set_font("Roboto", "B", 11)
-        pdf.set_text_color(40, 40, 80)
-        pdf.multi_cell(0, 6, f"{fname} — {score} баллов ({level} уровень)")
 
-        if desc:
-            pdf.set_font("Roboto", "", 10)
-            pdf.set_text_color(40, 40, 40)
-            pdf.multi_cell(0, 5, desc)
-        pdf.ln(2)
+def show_admin_panel():
+    """Панель замеров: ?admin=1 или переменная окружения ADMIN_PANEL=1."""
+    return st.query_params.get("admin") == "1" or os.environ.get("ADMIN_PANEL") == "1"
 
-    pdf_bytes = pdf.output(dest="S").encode("latin1")
-    return pdf_bytes
 
-RESULTS_FILE = "results.csv"
+def render_admin_panel():
+    """Перцентили длительности этапов в этом процессе сервера."""
+    with st.sidebar.expander("Замеры этапов", expanded=True):
+        summary = telemetry.stage_summary()
+        if not summary:
+            st.caption("Замеров пока нет.")
+            return
+        st.dataframe(
+            lazy_pandas().DataFrame(
+                {
+                    "Замеров": [v["count"] for v in summary.values()],
+                    "p50, мс": [round(v["p50_ms"], 2) for v in summary.values()],
+                    "p95, мс": [round(v["p95_ms"], 2) for v in summary.values()],
+                },
+                index=list(summary),
+            ),
+            use_container_width=True,
+        )
 
 
-def load_results():
-    if os.path.exists(RESULTS_FILE):
-        return pd.read_csv(RESULTS_FILE)
-    else:
-        return pd.DataFrame(
-            columns=["timestamp", "name"] + list(FACTOR_NAMES.values())
+def show_similar_profiles(factor_scores, own_name=None):
+    """k ближайших профилей из хранилища к профилю сессии."""
+    cols = st.columns(3)
+    kind = cols[0].radio("Искать", ["похожие", "дополняющие"], horizontal=True, key="sim_kind")
+    metric = cols[1].radio(
+        "Мера", METRICS, horizontal=True, key="sim_metric",
+        format_func={"cosine": "косинус", "euclidean": "евклидова"}.get,
+    )
+    k = cols[2].number_input("Сколько показать", min_value=1, max_value=50, value=5, key="sim_k")
+    with span("similarity", session_id()) as s:
+        index = get_index(get_store())
+        result = index.query(
+            factor_scores, k=int(k), metric=metric,
+            complementary=kind == "дополняющие", exclude_name=own_name,
         )
+        s["rows"] = index.size
+    st.dataframe(result, use_container_width=True, hide_index=True)
 
 
-def save_result(name, factor_scores):
-    df = load_results()
-    row = {
-        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
-        "name": name,
-    }
-    for fid, score in factor_scores.items():
-        row[FACTOR_NAMES[fid]] = score
-    df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
-    df.to_csv(RESULTS_FILE, index=False)
+TABS = ["📝 Пройти тест", "📊 Мой результат (эта сессия)", "📈 Групповой дашборд"]
 
 
-def show_radar_chart(factor_scores, title="Мотивационный профиль"):
-    labels = [FACTOR_NAMES[fid] for fid in sorted(factor_scores.keys())]
-    values = [factor_scores[fid] for fid in sorted(factor_scores.keys())]
-
-    fig = go.Figure()
-    fig.add_trace(go.Scatterpolar(
-        r=values + [values[0]],
-        theta=labels + [labels[0]],
-        fill="toself",
-        name="Профиль",
-    ))
-    fig.update_layout(
-        polar=dict(
-            radialaxis=dict(visible=True)
+def current_plan():
+    """План подсчёта версии опросника, выбранной в сессии."""
+    return load_plan(st.session_state.get("instrument") or DEFAULT_VERSION)
+
+
+_ANSWER_KEY = re.compile(r"p?q\d+_[a-z]$")
+
+
+def reset_answers():
+    """Сбрасывает ответы сессии при смене версии опросника."""
+    for key in list(st.session_state):
+        if key in ("answers_grid", "question_page") or _ANSWER_KEY.match(key):
+            del st.session_state[key]
+
+
+FULL_FORM_MODE = "Все вопросы сразу"
+PAGED_FORM_MODE = "По страницам"
+QUESTIONS_PER_PAGE = 5
+
+
+def complete_submission(name, factor_scores, plan):
+    st.session_state["factor_scores"] = factor_scores
+    # запись идёт в фоне пачками; ждём подтверждения не дольше ACK_WAIT
+    st.session_state["pending_save"] = save_result(
+        name.strip(), factor_scores, cohort_attributes(), plan.version
+    )
+    if show_save_status(wait=ACK_WAIT):
+        st.success("Ответы сохранены, мотивационный профиль рассчитан.")
+        st.info("Ваш результат также учтён в групповом дашборде.")
+    st.write("Ниже — ваш профиль мотивации.")
+    show_radar_chart(factor_scores, title=f"Профиль {name}")
+    show_bar_chart(factor_scores, title="12 факторов мотивации")
+    with span("archetypes", session_id()) as s:
+        model = get_model(get_store())
+        s["rows"] = int(model.counts.sum()) if model else 0
+    if model is not None:
+        i = model.assign(factor_scores)
+        st.info(f"Ваш мотивационный архетип: **{i + 1}. {model.labels()[i]}**")
+
+
+TREND_LABELS = {"day": "День", "week": "Неделя", "month": "Месяц"}
+
+
+def show_trends(trend):
+    """Средние факторов по дням/неделям/месяцам из дневных сумм агрегатов."""
+    cols = st.columns(2)
+    freq = cols[0].radio(
+        "Период", list(TREND_LABELS), format_func=TREND_LABELS.get,
+        horizontal=True, key="trend_freq",
+    )
+    window = cols[1].slider(
+        "Скользящее окно, периодов", 1, 12, 1, key="trend_window",
+        help="Средние по всем ответам за последние N периодов.",
+    )
+    fids = st.multiselect(
+        "Факторы", FACTOR_IDS, default=FACTOR_IDS, format_func=FACTOR_NAMES.get, key="trend_factors",
+    )
+    with span("charts", session_id()) as s:
+        periods, counts, means = trend.series(freq, window)
+        s["rows"] = len(periods)
+        if not periods or not fids:
+            return
+        labels = tuple(p.isoformat() if freq != "month" else p.strftime("%Y-%m") for p in periods)
+        series = tuple(
+            (fid, tuple(None if np.isnan(v) else round(float(v), 1) for v in column))
+            for fid, column in zip(FACTOR_IDS, means.T) if fid in fids
+        )
+        title = f"Средние значения факторов ({TREND_LABELS[freq].lower()}" + (
+            f", окно {window})" if window > 1 else ")"
+        )
+        if use_static_charts():
+            st.image(trend_png(labels, series, title))
+        else:
+            st.plotly_chart(trend_figure(labels, series, title), use_container_width=True)
+    st.caption(f"Ответов за последний период{' (окно)' if window > 1 else ''}: {int(counts[-1])}")
+
+
+def show_archetypes(model):
+    """Размеры архетипов и их центроиды на радарной диаграмме."""
+    labels = model.labels()
+    st.dataframe(
+        lazy_pandas().DataFrame(
+            {
+                "Архетип": [f"{i + 1}. {label}" for i, label in enumerate(labels)],
+                "Человек": model.counts,
+                "Доля, %": (100 * model.counts / max(1, model.counts.sum())).round(1),
+            }
         ),
-        showlegend=False,
-        title=title,
-        margin=dict(l=40, r=40, t=60, b=40),
+        use_container_width=True,
+        hide_index=True,
+    )
+    profiles = tuple(
+        (f"Архетип {i + 1}", score_key(model.centroid_scores(i))) for i in range(model.k)
     )
-    st.plotly_chart(fig, use_container_width=True)
+    with span("charts", session_id(), rows=model.k):
+        if use_static_charts():
+            cols = st.columns(min(model.k, 3))
+            for i, (title, key) in enumerate(profiles):
+                cols[i % len(cols)].image(radar_png(key, title))
+        else:
+            st.plotly_chart(
+                radar_multi_figure(profiles, "Центроиды архетипов"), use_container_width=True
+            )
 
 
-def show_bar_chart(factor_scores, title="12 факторов мотивации"):
-    labels = [FACTOR_NAMES[fid] for fid in sorted(factor_scores.keys())]
-    values = [factor_scores[fid] for fid in sorted(factor_scores.keys())]
-    fig = go.Figure(
-        data=[go.Bar(x=labels, y=values)]
-    )
-    fig.update_layout(
-        title=title,
-        xaxis_tickangle=-45,
-        margin=dict(l=40, r=40, t=60, b=120),
+def session_answers(plan):
+    """
+    Ответы сессии: один массив (вопросы, варианты) uint8 на оба режима ввода —
+    132 байта вместо словаря из 132 записей с ключами-кортежами. Подсчёт и
+    проверка сумм принимают его напрямую.
+    """
+    grid = st.session_state.get("answers_grid")
+    if grid is None or grid.shape != plan.shape:
+        grid = st.session_state["answers_grid"] = np.zeros(plan.shape, dtype=np.uint8)
+        st.session_state["question_page"] = 0
+    return grid
+
+
+def render_full_questionnaire(name, plan):
+    grid = session_answers(plan)
+    points = plan.points_per_question
+
+    with span("form_render", session_id(), rows=len(plan.questions)):
+        form = st.form("questionnaire")
+        form.write(f"Для каждого вопроса распределите {points} баллов между вариантами a, b, c, d.")
+
+        for row, q in enumerate(plan.questions):
+            form.markdown(f"**{q['num']}. {q['text']}**")
+            cols = form.columns(4)
+            for i, opt in enumerate(plan.option_letters):
+                # значение по умолчанию — из массива ответов сессии
+                grid[row, i] = cols[i].number_input(
+                    f"{opt}) {q['options'][opt]}",
+                    min_value=0,
+                    max_value=points,
+                    step=1,
+                    key=f"q{q['num']}_{opt}",
+                    value=int(grid[row, i]),
+                )
+
+            form.markdown("---")
+
+    submitted = form.form_submit_button("Отправить ответы и рассчитать профиль")
+
+    if submitted:
+        # Валидация сумм по вопросам
+        with span("validation", session_id(), rows=len(plan.questions)):
+            errors = [
+                f"Вопрос {num}: сумма баллов = {total}, должна быть {points}"
+                for num, total in invalid_questions(grid, plan)
+            ]
+
+        if not name.strip():
+            st.error("Пожалуйста, введите имя.")
+        elif errors:
+            st.error("Найдены ошибки в распределении баллов:")
+            for e in errors:
+                st.write("• " + e)
+            st.info("Исправьте суммы и нажмите кнопку ещё раз.")
+        else:
+            with span("calculate_factors", session_id(), rows=1):
+                factor_scores = calculate_factors(grid, plan)
+            complete_submission(name, factor_scores, plan)
+
+
+def render_paged_questionnaire(name, plan):
+    """
+    Показывает только текущую страницу вопросов. Ответы сессии хранятся
+    в массиве 33×4 (uint8), суммы проверяются при уходе со страницы,
+    поэтому после отправки повторно ничего не перебирается.
+    """
+    state = st.session_state
+    questions, points = plan.questions, plan.points_per_question
+    grid = session_answers(plan)
+    ok = question_sums(grid) == points
+    n_pages = -(-len(questions) // QUESTIONS_PER_PAGE)
+    page = state.get("question_page", 0)
+    start = page * QUESTIONS_PER_PAGE
+    stop = min(start + QUESTIONS_PER_PAGE, len(questions))
+
+    st.progress(int(ok.sum()) / len(questions), text=f"Страница {page + 1} из {n_pages}")
+    with span("form_render", session_id(), rows=stop - start):
+        form = st.form(f"questionnaire_page_{page}")
+        form.write(f"Для каждого вопроса распределите {points} баллов между вариантами a, b, c, d.")
+        values = np.zeros((stop - start, len(plan.option_letters)), dtype=np.uint8)
+        for row, q in enumerate(questions[start:stop]):
+            form.markdown(f"**{q['num']}. {q['text']}**")
+            cols = form.columns(4)
+            for i, opt in enumerate(plan.option_letters):
+                values[row, i] = cols[i].number_input(
+                    f"{opt}) {q['options'][opt]}",
+                    min_value=0,
+                    max_value=points,
+                    step=1,
+                    key=f"pq{q['num']}_{opt}",
+                    value=int(grid[start + row, i]),
+                )
+            form.markdown("---")
+
+    nav = form.columns(2)
+    back = nav[0].form_submit_button("← Назад", disabled=page == 0)
+    last = page == n_pages - 1
+    forward = nav[1].form_submit_button(
+        "Отправить ответы и рассчитать профиль" if last else "Далее →"
     )
-    st.plotly_chart(fig, use_container_width=True)
+    if not (back or forward):
+        return
+
+    with span("validation", session_id(), rows=stop - start):
+        grid[start:stop] = values
+        sums = question_sums(values)
+        ok[start:stop] = sums == points
+    if back:
+        state["question_page"] = page - 1
+        st.rerun()
+
+    errors = [
+        f"Вопрос {q['num']}: сумма баллов = {int(total)}, должна быть {points}"
+        for q, total in zip(questions[start:stop], sums)
+        if total != points
+    ]
+    if errors:
+        st.error("Найдены ошибки в распределении баллов:")
+        for e in errors:
+            st.write("• " + e)
+        return
+    if not last:
+        state["question_page"] = page + 1
+        st.rerun()
+
+    if not name.strip():
+        st.error("Пожалуйста, введите имя.")
+    elif not ok.all():
+        missing = ", ".join(str(questions[i]["num"]) for i in np.flatnonzero(~ok))
+        st.error(f"Не заполнены корректно вопросы: {missing}")
+    else:
+        with span("calculate_factors", session_id(), rows=1):
+            factor_scores = calculate_factors(grid, plan)
+        complete_submission(name, factor_scores, plan)
+
+
+def render_my_result(name):
+    """Вкладка «Мой результат»: графики, перцентили, PDF и похожие профили."""
+    if "factor_scores" not in st.session_state:
+        st.info("Сначала заполните опросник на вкладке «Пройти тест».")
+    else:
+        show_save_status()
+        factor_scores = st.session_state["factor_scores"]
+        name_for_pdf = st.session_state.get("participant_name", "Участник")
+
+        show_radar_chart(factor_scores, title="Ваш мотивационный профиль")
+        show_bar_chart(factor_scores, title="Ваши значения по 12 факторам")
+
+        st.subheader("Таблица факторов")
+        store = get_store()
+        cube = get_aggregates(store).cube
+        norm = {}
+        cols = st.columns(len(COHORT_COLUMNS) + 1)
+        for col, box in zip(COHORT_COLUMNS, cols):
+            value = box.selectbox(
+                f"Сравнивать: {COHORT_LABELS[col].lower()}", ["Все"] + cube.values(col),
+                key=f"norm_{col}",
+            )
+            norm[col] = None if value == "Все" else value
+        norm["name_prefix"] = cols[-1].text_input(
+            "Начало имени (пусто — все):", "", key="norm_prefix",
+        ).strip() or None
+        with span("percentiles", session_id()) as s:
+            # подгруппы по факультету/уровню — из агрегатов, с префиксом имени — проход по строкам
+            hist = get_histogram(store, **norm)
+            percentiles = hist.percentiles(factor_scores)
+            s["rows"] = hist.count
+        df_ind = lazy_pandas().DataFrame(
+            {
+                "Фактор": [
+                    FACTOR_NAMES[fid] for fid in sorted(factor_scores.keys())
+                ],
+                "Баллы": [
+                    factor_scores[fid] for fid in sorted(factor_scores.keys())
+                ],
+            }
+        )
+        if percentiles:
+            df_ind["Перцентиль"] = [
+                round(percentiles[fid]) for fid in sorted(factor_scores.keys())
+            ]
+            st.caption(
+                f"Перцентиль — доля группы ({hist.count} чел.) со значением фактора "
+                "ниже вашего; совпадающие значения учитываются наполовину."
+            )
+        st.dataframe(df_ind, use_container_width=True)
+
+        st.subheader("Скачать индивидуальный PDF-отчёт")
+        sid = session_id()
+
+        def pdf_bytes():
+            # строится (и загружает fpdf) только по нажатию кнопки
+            with span("build_pdf_report", sid, rows=1):
+                return build_pdf_report(name_for_pdf, factor_scores, percentiles)
+
+        safe_name = name_for_pdf.replace(" ", "_")
+        st.download_button(
+            label="📄 Скачать PDF-отчёт",
+            data=pdf_bytes,
+            file_name=f"motivation_profile_{safe_name}.pdf",
+            mime="application/pdf",
+        )
+
+        st.subheader("Похожие и дополняющие профили")
+        show_similar_profiles(factor_scores, name.strip())
+
+
+def render_dashboard():
+    """Вкладка «Групповой дашборд»: агрегаты, подгруппы, архетипы и строки."""
+    store = get_store()
+    aggregates = get_aggregates(store)
+    total = aggregates.total.count
+    if total == 0:
+        st.info("Пока нет данных. Результаты появятся после первых прохождений теста.")
+    else:
+        name_prefix = st.text_input("Фильтр по имени (начало имени):", "").strip()
+        filters = {"name_prefix": name_prefix or None}
+        cols = st.columns(len(COHORT_COLUMNS))
+        for col, box in zip(COHORT_COLUMNS, cols):
+            filters[col] = box.selectbox(
+                COHORT_LABELS[col], ["Все"] + aggregates.cube.values(col), key=f"filter_{col}"
+            )
+            if filters[col] == "Все":
+                filters[col] = None
+        versions = available_versions()
+        if len(versions) > 1:
+            filters[INSTRUMENT_COLUMN] = st.selectbox(
+                "Версия опросника", ["Все"] + versions, key="filter_instrument"
+            )
+            if filters[INSTRUMENT_COLUMN] == "Все":
+                filters[INSTRUMENT_COLUMN] = None
+        cohort = {col: filters[col] for col in COHORT_COLUMNS}
+        st.write(f"Всего результатов: **{total}**")
+        # по подгруппам — готовый куб агрегатов, с фильтром по имени
+        # или версии опросника — агрегация в хранилище
+        if name_prefix or filters.get(INSTRUMENT_COLUMN):
+            stats = FactorStats.from_dict(store.factor_stats(**filters))
+            st.write(f"По фильтру: **{stats.count}**")
+        elif any(cohort.values()):
+            stats = aggregates.cube.get(**cohort)
+            st.write(f"По фильтру: **{stats.count}**")
+        else:
+            stats = aggregates.total
+
+        if stats.count:
+            st.subheader("Сводка по факторам")
+            st.dataframe(summary_frame(stats), use_container_width=True)
+
+            st.subheader("Средние значения по факторам (группа)")
+            show_bar_chart(
+                stats.means(),
+                title="Средние значения факторов (группа)"
+            )
+
+            st.subheader("Сравнение подгрупп")
+            dimension = st.radio(
+                "Сравнивать по:", COHORT_COLUMNS, format_func=COHORT_LABELS.get,
+                horizontal=True, key="compare_by",
+            )
+            if name_prefix or filters.get(INSTRUMENT_COLUMN):
+                st.caption("Сравнение строится по всем именам и версиям опросника.")
+            st.dataframe(
+                cohort_comparison_frame(aggregates.cube.breakdown(dimension, **cohort)),
+                use_container_width=True,
+            )
+
+            st.subheader("Динамика по времени")
+            if any(v for v in filters.values()):
+                st.caption("Динамика строится по всей группе, без фильтров.")
+            show_trends(aggregates.trend)
+
+            st.subheader("Мотивационные архетипы")
+            with span("archetypes", session_id()) as s:
+                model = get_model(store)
+                s["rows"] = int(model.counts.sum()) if model else 0
+            if model is None:
+                st.info("Для архетипов пока недостаточно результатов.")
+            else:
+                show_archetypes(model)
+
+            st.subheader("Экспорт результатов")
+            show_export(store, filters, stats.count)
+
+            if aggregates.cube.get(**cohort).count:
+                st.download_button(
+                    "Командный отчёт (PDF)",
+                    data=lambda: build_team_report(store, **cohort),
+                    file_name="team_report.pdf",
+                    mime="application/pdf",
+                )
+                if name_prefix or filters.get(INSTRUMENT_COLUMN):
+                    st.caption("Командный отчёт строится по подгруппе без фильтров по имени и версии опросника.")
+
+            if st.toggle("Показать строки результатов"):
+                show_results_page(store, filters, stats.count)
 
 
 def app():
@@ -188,6 +665,11 @@ def app():
         layout="wide"
     )
     st.title("Мотивационный опросник: 12 факторов мотивационного профиля")
+    st.sidebar.toggle(
+        "Облегчённые графики (картинки)",
+        key="static_charts",
+        help="Для медленного соединения: графики отдаются готовыми изображениями.",
+    )
 
     st.markdown(
         """
@@ -200,132 +682,57 @@ def app():
         """
     )
 
-    tab1, tab2, tab3 = st.tabs(
-        ["📝 Пройти тест", "📊 Мой результат (эта сессия)", "📈 Групповой дашборд"]
-    )
+    # вкладки с состоянием: результаты и дашборд (pandas, графики, агрегаты)
+    # считаются только для открытой вкладки, а не при каждой отрисовке формы
+    tab1, tab2, tab3 = st.tabs(TABS, key="main_tab", on_change="rerun")
 
     # ---------- TAB 1: ПРОЙТИ ТЕСТ ----------
     with tab1:
         st.header("Шаг 1. Заполните опросник")
+        if "pending_save" in st.session_state and show_save_status():
+            st.success("Ваш предыдущий результат сохранён.")
         name = st.text_input("Ваше имя (для индивидуального отчёта):", "")
+        with st.expander("Подгруппа (необязательно)"):
+            cols = st.columns(2)
+            cols[0].text_input(COHORT_LABELS["faculty"], key="cohort_faculty")
+            cols[1].selectbox(COHORT_LABELS["level"], [""] + LEVELS, key="cohort_level")
+
+        # файл с ошибкой в выбор не попадает (его ошибки — python instruments.py)
+        versions = valid_versions()
+        if len(versions) > 1:
+            st.selectbox(
+                "Версия опросника", versions, key="instrument",
+                index=versions.index(DEFAULT_VERSION) if DEFAULT_VERSION in versions else 0,
+                format_func=lambda v: load_plan(v).title, on_change=reset_answers,
+            )
+        plan = current_plan()
 
-        if "answers" not in st.session_state:
-            st.session_state["answers"] = {}
-
-        form = st.form("questionnaire")
-        form.write("Для каждого вопроса распределите 11 баллов между вариантами a, b, c, d.")
-
-        for q in QUESTIONS:
-            form.markdown(f"**{q['num']}. {q['text']}**")
-            cols = form.columns(4)
-            for i, opt in enumerate(["a", "b", "c", "d"]):
-                label = f"{opt}) {q['options'][opt]}"
-                key = f"q{q['num']}_{opt}"
-                # значение по умолчанию — из session_state, если уже есть
-                default_val = st.session_state["answers"].get((q["num"], opt), 0)
-                val = cols[i].number_input(
-                    label,
-                    min_value=0,
-                    max_value=11,
-                    step=1,
-                    key=key,
-                    value=default_val,
-                )
-                st.session_state["answers"][(q["num"], opt)] = val
-
-            form.markdown("---")
-
-        submitted = form.form_submit_button("Отправить ответы и рассчитать профиль")
-
-        if submitted:
-            # Валидация сумм по вопросам
-            errors = []
-            for q in QUESTIONS:
-                s = 0
-                for opt in ["a", "b", "c", "d"]:
-                    s += st.session_state["answers"].get((q["num"], opt), 0)
-                if s != 11:
-                    errors.append(f"Вопрос {q['num']}: сумма баллов = {s}, должна быть 11")
-
-            if not name.strip():
-                st.error("Пожалуйста, введите имя.")
-            elif errors:
-                st.error("Найдены ошибки в распределении баллов:")
-                for e in errors:
-                    st.write("• " + e)
-                st.info("Исправьте суммы и нажмите кнопку ещё раз.")
-            else:
-                factor_scores = calculate_factors(st.session_state["answers"])
-                st.session_state["factor_scores"] = factor_scores
-                st.success("Ответы сохранены, мотивационный профиль рассчитан.")
-                # Сохранение результата в CSV
-                save_result(name.strip(), factor_scores)
-                st.info("Ваш результат также учтён в групповом дашборде.")
-                st.write("Ниже — ваш профиль мотивации.")
-                show_radar_chart(factor_scores, title=f"Профиль {name}")
-                show_bar_chart(factor_scores, title="12 факторов мотивации")
+        mode = st.radio(
+            "Режим ввода:",
+            [FULL_FORM_MODE, PAGED_FORM_MODE],
+            horizontal=True,
+            key="input_mode",
+        )
+        if mode == PAGED_FORM_MODE:
+            render_paged_questionnaire(name, plan)
+        else:
+            render_full_questionnaire(name, plan)
 
     # ---------- TAB 2: МОЙ РЕЗУЛЬТАТ ----------
     with tab2:
         st.header("Ваш результат в текущей сессии")
-        if "factor_scores" not in st.session_state:
-            st.info("Сначала заполните опросник на вкладке «Пройти тест».")
-        else:
-            factor_scores = st.session_state["factor_scores"]
-            name_for_pdf = st.session_state.get("participant_name", "Участник")
-
-            show_radar_chart(factor_scores, title="Ваш мотивационный профиль")
-            show_bar_chart(factor_scores, title="Ваши значения по 12 факторам")
-
-            st.subheader("Таблица факторов")
-            df_ind = pd.DataFrame(
-                {
-                    "Фактор": [
-                        FACTOR_NAMES[fid] for fid in sorted(factor_scores.keys())
-                    ],
-                    "Баллы": [
-                        factor_scores[fid] for fid in sorted(factor_scores.keys())
-                    ],
-                }
-            )
-            st.dataframe(df_ind, use_container_width=True)
-
-            st.subheader("Скачать индивидуальный PDF-отчёт")
-            pdf_bytes = build_pdf_report(name_for_pdf, factor_scores)
-            safe_name = name_for_pdf.replace(" ", "_")
-            st.download_button(
-                label="📄 Скачать PDF-отчёт",
-                data=pdf_bytes,
-                file_name=f"motivation_profile_{safe_name}.pdf",
-                mime="application/pdf",
-            )
+        if tab2.open:
+            render_my_result(name)
 
     # ---------- TAB 3: ГРУППОВОЙ ДАШБОРД ----------
     with tab3:
         st.header("Групповой дашборд")
-        df = load_results()
-        if df.empty:
-            st.info("Пока нет данных. Результаты появятся после первых прохождений теста.")
-        else:
-            st.write(f"Всего результатов: **{len(df)}**")
-            st.dataframe(df, use_container_width=True)
+        if tab3.open:
+            render_dashboard()
 
-            # Средние значения по факторам
-            factor_cols = list(FACTOR_NAMES.values())
-            mean_scores = df[factor_cols].mean().to_dict()
-            st.subheader("Средние значения по факторам (группа)")
-            mean_factor_scores = {
-                fid: mean_scores[FACTOR_NAMES[fid]] for fid in FACTOR_NAMES.keys()
-            }
-            show_bar_chart(
-                mean_factor_scores,
-                title="Средние значения факторов (группа)"
-            )
-
-            st.markdown(
-                "_При желании сюда можно добавить фильтры по факультетам, уровням N-2/N-3 и др., "
-                "если в results.csv будут соответствующие столбцы._"
-            )
+    if show_admin_panel():
+        render_admin_panel()
+    telemetry.flush()
 
 
 if __name__ == "__main__":
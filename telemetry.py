@@ -0,0 +1,113 @@
+# telemetry.py
+# Встроенные замеры этапов перезапуска app() без внешнего профилировщика.
+# Каждый span — (этап, длительность, id сессии, число строк). Последние
+# значения по этапам хранятся в памяти процесса для панели администратора;
+# при заданных переменных окружения они также выгружаются на диск:
+#   TELEMETRY_JSONL — путь JSON Lines, по строке на span;
+#   TELEMETRY_PROM  — путь файла в текстовом формате Prometheus (summary по этапам).
+
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+WINDOW = 5000  # сколько последних замеров на этап держать для перцентилей
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC = "motivation_app_stage_seconds"
+
+_lock = threading.Lock()
+_recent = collections.defaultdict(lambda: collections.deque(maxlen=WINDOW))
+_totals = collections.defaultdict(lambda: [0, 0.0])  # этап -> [count, sum_seconds]
+
+
+def _write_jsonl(path, record):
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+def record(stage, seconds, session_id=None, rows=None):
+    """Регистрирует один замер этапа."""
+    with _lock:
+        _recent[stage].append(seconds)
+        totals = _totals[stage]
+        totals[0] += 1
+        totals[1] += seconds
+    path = os.environ.get("TELEMETRY_JSONL")
+    if path:
+        _write_jsonl(path, {
+            "ts": time.time(),
+            "stage": stage,
+            "seconds": round(seconds, 6),
+            "session_id": session_id,
+            "rows": rows,
+        })
+
+
+@contextlib.contextmanager
+def span(stage, session_id=None, rows=None):
+    """
+    Замер блока кода. Число строк можно уточнить внутри блока:
+        with span("load_results", sid) as s:
+            df = ...
+            s["rows"] = len(df)
+    """
+    info = {"rows": rows}
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        record(stage, time.perf_counter() - start, session_id, info["rows"])
+
+
+def stage_summary():
+    """{этап: {"count", "p50_ms", "p95_ms", "p99_ms"}} по последним замерам в памяти."""
+    with _lock:
+        snapshot = {stage: (list(values), _totals[stage][0]) for stage, values in _recent.items()}
+    summary = {}
+    for stage, (values, count) in sorted(snapshot.items()):
+        if not values:
+            continue
+        pcts = np.percentile(values, [q * 100 for q in QUANTILES]) * 1000
+        summary[stage] = {"count": count}
+        summary[stage].update({f"p{int(q * 100)}_ms": float(v) for q, v in zip(QUANTILES, pcts)})
+    return summary
+
+
+def prometheus_text():
+    """Метрики в текстовом формате Prometheus (тип summary, метка stage)."""
+    with _lock:
+        snapshot = {
+            stage: (list(values), tuple(_totals[stage])) for stage, values in _recent.items()
+        }
+    lines = [
+        f"# HELP {METRIC} Длительность этапов перезапуска app().",
+        f"# TYPE {METRIC} summary",
+    ]
+    for stage, (values, (count, total)) in sorted(snapshot.items()):
+        if not values:
+            continue
+        for q, v in zip(QUANTILES, np.quantile(values, QUANTILES)):
+            lines.append(f'{METRIC}{{stage="{stage}",quantile="{q}"}} {v:.6f}')
+        lines.append(f'{METRIC}_sum{{stage="{stage}"}} {total:.6f}')
+        lines.append(f'{METRIC}_count{{stage="{stage}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+def flush():
+    """Перезаписывает файл TELEMETRY_PROM (атомарно), если он задан."""
+    path = os.environ.get("TELEMETRY_PROM")
+    if not path:
+        return
+    text = prometheus_text()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    # сессии Streamlit — потоки одного процесса: запись и замена под блокировкой,
+    # иначе два flush делят один временный файл
+    with _lock:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
@@ -0,0 +1,137 @@
+# writer.py
+# Фоновая запись результатов с групповой фиксацией.
+# Отправка формы только кладёт строку в ограниченную очередь процесса и
+# получает Future. Фоновый поток забирает из очереди всё накопившееся
+# (до MAX_BATCH строк) и пишет одной пачкой через append_results: одна
+# блокировка, одна дозапись и одно обновление агрегатов на пачку, а не на
+# каждую строку. Future каждой строки завершается после фиксации пачки
+# (или с исключением записи) — это подтверждение для сессии.
+# При выходе из процесса очередь дописывается (atexit).
+
+import atexit
+import concurrent.futures as cf
+import queue
+import threading
+import time
+
+from aggregates import append_results
+from telemetry import span
+
+MAX_QUEUE = 1000  # строк в очереди; при переполнении submit ждёт (backpressure)
+MAX_BATCH = 500  # строк в одной пачке записи
+SUBMIT_TIMEOUT = 30  # сколько ждать места в очереди, секунды
+CLOSE_TIMEOUT = 10  # сколько close() ждёт дозаписи очереди при выходе, секунды
+
+_STOP = object()
+
+
+class ResultWriter:
+    """Очередь строк одного хранилища и поток, который пишет их пачками."""
+
+    def __init__(self, store, maxsize=MAX_QUEUE, max_batch=MAX_BATCH):
+        self.store = store
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._run, name=f"result-writer:{store.path}", daemon=True)
+        self._thread.start()
+
+    def submit(self, row, timeout=SUBMIT_TIMEOUT):
+        """
+        Ставит строку в очередь; возвращает Future, который завершится
+        числом строк в зафиксированной пачке. queue.Full — если за timeout
+        место в очереди не освободилось.
+        """
+        if not self._thread.is_alive():
+            raise RuntimeError("поток записи результатов остановлен")
+        future = cf.Future()
+        self._queue.put((row, future), timeout=timeout)
+        return future
+
+    def _drain(self, first):
+        """Пачка из first и всего, что уже лежит в очереди; и флаг остановки."""
+        batch = [first]
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.task_done()
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            batch, stop = self._drain(item)
+            try:
+                with span("write_batch", rows=len(batch)):
+                    append_results(self.store, [row for row, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for _, future in batch:
+                    future.set_result(len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Ждёт, пока все поставленные в очередь строки будут записаны."""
+        self._queue.join()
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """
+        Дописывает очередь и останавливает поток, ожидая не дольше timeout
+        секунд: если поток записи завис (например, на вводе-выводе) и
+        очередь полна, выход процесса не блокируется.
+        """
+        if not self._thread.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(max(deadline - time.monotonic(), 0))
+
+
+_writers = {}
+_lock = threading.Lock()
+
+
+def get_writer(store):
+    """Писатель хранилища (один на store.path в процессе)."""
+    with _lock:
+        writer = _writers.get(store.path)
+        if writer is None or not writer._thread.is_alive():
+            writer = _writers[store.path] = ResultWriter(store)
+        return writer
+
+
+def submit_result(store, row):
+    """Ставит строку результата в очередь записи хранилища; возвращает Future."""
+    return get_writer(store).submit(row)
+
+
+def flush_all():
+    """Дожидается записи всех очередей процесса."""
+    with _lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.flush()
+
+
+@atexit.register
+def close_all():
+    with _lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()